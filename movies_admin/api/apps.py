@@ -0,0 +1,17 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
+
+
+class ApiConfig(AppConfig):
+    name = 'api'
+
+    def ready(self):
+        from movies.models import FilmWork, FilmWorkGenre, FilmWorkPerson, Genre, Person
+
+        from .cache import invalidate
+
+        # Каталог меняется только через админку: любая запись сбрасывает кеш API.
+        # QuerySet.update() сигналов не шлёт и кеш не сбрасывает.
+        for model in (FilmWork, Genre, Person, FilmWorkGenre, FilmWorkPerson):
+            for signal in (post_save, post_delete):
+                signal.connect(invalidate, sender=model)
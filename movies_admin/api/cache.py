@@ -0,0 +1,62 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+
+GENERATION_KEY = 'api.generation'
+
+
+def api_cache():
+    return caches[settings.API_CACHE]
+
+
+def generation() -> str:
+    """
+    Поколение данных каталога: меняется при каждой записи через модели и не реже
+    раза в API_CACHE_SECONDS, чтобы записи в обход сигналов (QuerySet.update(),
+    sqlite_to_postgres, SQL вручную) тоже становились видны. Входит в ключи и ETag
+    """
+    return api_cache().get_or_set(GENERATION_KEY, lambda: uuid.uuid4().hex, settings.API_CACHE_SECONDS)
+
+
+def invalidate(**kwargs) -> None:
+    """
+    Обработчик post_save/post_delete: сменить поколение после коммита,
+    чтобы параллельный запрос не закешировал данные до записи под новым ключом
+    """
+    transaction.on_commit(lambda: api_cache().set(GENERATION_KEY, uuid.uuid4().hex, settings.API_CACHE_SECONDS))
+
+
+class CachedResponseMixin:
+    """
+    Кеш ответов GET по полному пути запроса. ETag вычисляется из поколения
+    и пути, поэтому If-None-Match проверяется без обращения к PostgreSQL.
+    """
+
+    def get(self, request, *args, **kwargs):
+        current = generation()
+        path = request.get_full_path()
+        digest = hashlib.md5(f'{current}:{path}'.encode()).hexdigest()
+        etag = f'"{digest}"'
+
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+
+        key = f'api.response.{digest}'
+        body = api_cache().get(key)
+        if body is not None:
+            response = HttpResponse(body, content_type='application/json')
+        else:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            api_cache().set(key, response.content, settings.API_CACHE_SECONDS)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
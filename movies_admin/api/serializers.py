@@ -0,0 +1,51 @@
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+_encoder = DjangoJSONEncoder()
+
+
+class StdlibBackend:
+    name = 'json'
+
+    @staticmethod
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class OrjsonBackend:
+    name = 'orjson'
+
+    @staticmethod
+    def dumps(obj) -> bytes:
+        # UUID orjson сериализует сам. Даты и время, Decimal и ленивые строки — как Django,
+        # чтобы формат (миллисекунды, «Z») не зависел от JSON_BACKEND.
+        return orjson.dumps(
+            obj,
+            default=_encoder.default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+
+
+BACKENDS = {StdlibBackend.name: StdlibBackend, OrjsonBackend.name: OrjsonBackend}
+
+
+def get_backend(name=None):
+    """Бэкенд из settings.JSON_BACKEND, по умолчанию orjson, если он установлен"""
+    name = name or getattr(settings, 'JSON_BACKEND', None) or ('orjson' if orjson is not None else 'json')
+    if name == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_BACKEND=orjson, but orjson is not installed.')
+    return BACKENDS[name]
+
+
+def render_json(data, status=200, **kwargs) -> HttpResponse:
+    """Замена JsonResponse, сериализующая данные выбранным бэкендом"""
+    kwargs.setdefault('content_type', 'application/json')
+    return HttpResponse(get_backend().dumps(data), status=status, **kwargs)
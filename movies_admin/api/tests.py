@@ -0,0 +1,100 @@
+import operator
+import uuid
+
+from django.core.exceptions import BadRequest
+from django.core.signing import dumps
+from django.test import SimpleTestCase
+
+from api.v1.pagination import CURSOR_SALT, NEXT, decode_cursor, encode_cursor, paginate_by_cursor
+
+LOOKUPS = {'gt': operator.gt, 'gte': operator.ge, 'lt': operator.lt, 'lte': operator.le}
+
+
+class FakeQuerySet:
+    """Строки в памяти с filter(Q), order_by и срезами — столько, сколько нужно пагинации"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def _matches(self, row, condition) -> bool:
+        if isinstance(condition, tuple):
+            lookup, value = condition
+            field, _, name = lookup.partition('__')
+            return LOOKUPS.get(name, operator.eq)(row[field], value)
+        results = [self._matches(row, child) for child in condition.children]
+        matched = all(results) if condition.connector == 'AND' else any(results)
+        return not matched if condition.negated else matched
+
+    def filter(self, condition):
+        return FakeQuerySet(row for row in self.rows if self._matches(row, condition))
+
+    def order_by(self, *fields):
+        reverse = fields[0].startswith('-')
+        names = [field.lstrip('-') for field in fields]
+        return FakeQuerySet(sorted(self.rows, key=lambda row: [row[name] for name in names], reverse=reverse))
+
+    def __getitem__(self, item):
+        return self.rows[item]
+
+
+def make_rows(count):
+    # Повторяющиеся названия проверяют, что id разрешает равенство по title.
+    return [{'id': str(uuid.UUID(int=number * 7919 % 1000)), 'title': f'Film {number % 7}'} for number in range(count)]
+
+
+class CursorTokenTest(SimpleTestCase):
+    def test_round_trip(self):
+        row = {'title': 'Star Wars', 'id': uuid.UUID('3d825f60-9fff-4dfe-b294-1a45fa1e115d')}
+        token = encode_cursor(NEXT, row)
+        self.assertNotIn('Star', token)
+        self.assertEqual(decode_cursor(token), (NEXT, 'Star Wars', '3d825f60-9fff-4dfe-b294-1a45fa1e115d'))
+
+    def test_rejects_garbage_and_tampering(self):
+        token = encode_cursor(NEXT, {'title': 'a', 'id': '1'})
+        for bad in ('garbage', token[:-2] + 'xx', dumps(('x', 'a', '1'), salt=CURSOR_SALT), dumps(('n', 'a', '1'))):
+            with self.subTest(token=bad), self.assertRaises(BadRequest):
+                decode_cursor(bad)
+
+
+class PaginateByCursorTest(SimpleTestCase):
+    page_size = 4
+
+    def setUp(self):
+        self.queryset = FakeQuerySet(make_rows(23))
+        self.expected = [(row['title'], row['id']) for row in self.queryset.order_by('title', 'id')]
+
+    def keys(self, page):
+        return [(row['title'], row['id']) for row in page['results']]
+
+    def test_first_page(self):
+        page = paginate_by_cursor(self.queryset, '', self.page_size)
+        self.assertIsNone(page['prev'])
+        self.assertIsNotNone(page['next'])
+        self.assertEqual(self.keys(page), self.expected[: self.page_size])
+
+    def test_walk_forward_and_back(self):
+        pages = [paginate_by_cursor(self.queryset, '', self.page_size)]
+        while pages[-1]['next']:
+            pages.append(paginate_by_cursor(self.queryset, pages[-1]['next'], self.page_size))
+        self.assertEqual([key for page in pages for key in self.keys(page)], self.expected)
+        self.assertEqual(len(pages), 6)
+
+        backwards = []
+        token = pages[-1]['prev']
+        while token:
+            page = paginate_by_cursor(self.queryset, token, self.page_size)
+            backwards = self.keys(page) + backwards
+            token = page['prev']
+        self.assertEqual(backwards, self.expected[: len(self.expected) - len(pages[-1]['results'])])
+
+    def test_next_from_previous_page(self):
+        second = paginate_by_cursor(
+            self.queryset, paginate_by_cursor(self.queryset, '', self.page_size)['next'], self.page_size
+        )
+        first = paginate_by_cursor(self.queryset, second['prev'], self.page_size)
+        self.assertIsNone(first['prev'])
+        self.assertEqual(self.keys(paginate_by_cursor(self.queryset, first['next'], self.page_size)), self.keys(second))
+
+    def test_empty(self):
+        page = paginate_by_cursor(FakeQuerySet([]), '', self.page_size)
+        self.assertEqual(page, {'prev': None, 'next': None, 'results': []})
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import BadRequest
+from django.db.models import Q
+
+from api.cache import api_cache, generation
+
+CURSOR_SALT = "api.v1.movies.cursor"
+NEXT, PREV = "n", "p"
+
+
+def encode_cursor(direction: str, row: dict) -> str:
+    """Непрозрачный токен позиции (title, id) с направлением чтения"""
+    return signing.dumps((direction, row["title"], str(row["id"])), salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token: str) -> tuple:
+    try:
+        direction, title, pk = signing.loads(token, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise BadRequest("Invalid cursor.")
+    if direction not in (NEXT, PREV):
+        raise BadRequest("Invalid cursor.")
+    return direction, title, pk
+
+
+def cached_count(key: str, queryset) -> int:
+    """
+    Общее количество строк, пересчитывается не чаще раза в MOVIES_COUNT_CACHE_SECONDS
+    и сразу после записи в каталог, которая меняет поколение кеша API
+    """
+    return api_cache().get_or_set(f"{key}.{generation()}", queryset.count, settings.MOVIES_COUNT_CACHE_SECONDS)
+
+
+def paginate_by_cursor(queryset, token: str, page_size: int) -> dict:
+    """
+    Страница по ключу (title, id) без OFFSET: условие по ключу последней
+    (или первой при движении назад) строки прошлой страницы и LIMIT
+    page_size + 1, чтобы узнать, есть ли строки дальше. Стоимость любой
+    страницы та же, что и первой.
+    """
+    direction, title, pk = decode_cursor(token) if token else (NEXT, None, None)
+    if direction == NEXT:
+        if token:
+            queryset = queryset.filter(Q(title__gte=title) & (Q(title__gt=title) | Q(id__gt=pk)))
+        rows = list(queryset.order_by("title", "id")[: page_size + 1])
+        has_more, rows = len(rows) > page_size, rows[:page_size]
+        return {
+            "prev": encode_cursor(PREV, rows[0]) if token and rows else None,
+            "next": encode_cursor(NEXT, rows[-1]) if has_more else None,
+            "results": rows,
+        }
+
+    queryset = queryset.filter(Q(title__lte=title) & (Q(title__lt=title) | Q(id__lt=pk)))
+    rows = list(queryset.order_by("-title", "-id")[: page_size + 1])
+    has_more, rows = len(rows) > page_size, rows[:page_size][::-1]
+    return {
+        "prev": encode_cursor(PREV, rows[0]) if has_more else None,
+        "next": encode_cursor(NEXT, rows[-1]) if rows else None,
+        "results": rows,
+    }
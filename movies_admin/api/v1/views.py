@@ -1,48 +1,86 @@
 import sys
+from math import ceil
 
-from django.contrib.postgres.aggregates import ArrayAgg
-from django.db.models import Q
-from django.http import JsonResponse
+from django.contrib.postgres.fields import ArrayField
+from django.db.models import CharField, OuterRef, Subquery
 from django.views.generic.detail import BaseDetailView
 from django.views.generic.list import BaseListView
 
 sys.path.append("movies")
-from movies.models import FilmWork, PersonRoleType
+from movies.models import FilmWork, FilmWorkGenre, FilmWorkPerson, PersonRoleType
 
+from api.cache import CachedResponseMixin
+from api.serializers import render_json
+from api.v1.pagination import cached_count, paginate_by_cursor
 
-class MoviesApiMixin:
+
+class ArraySubquery(Subquery):
+    """ARRAY(подзапрос) для одной колонки, в Django 3.2 его ещё нет"""
+
+    template = "ARRAY(%(subquery)s)"
+
+    def __init__(self, queryset, **extra):
+        super().__init__(queryset, output_field=ArrayField(CharField()), **extra)
+
+
+class MoviesApiMixin(CachedResponseMixin):
     model = FilmWork
     http_method_names = ["get"]
 
-    def _aggregate_person(role: str):
-        return ArrayAgg(
-            "filmworkperson__person_id__full_name",
-            filter=Q(filmworkperson__role=role),
-            distinct=True,
+    # Жанры и люди собираются коррелированными подзапросами по индексам
+    # связей фильма: без соединения жанров с людьми и размножения строк
+    # жанры × персоны перед DISTINCT, как у ArrayAgg по двум связям.
+    # DISTINCT ON сохраняет в подзапросе сортировку, обычный DISTINCT
+    # Django 3.2 из подзапроса выбрасывает вместе с ORDER BY.
+    @staticmethod
+    def _genres():
+        return ArraySubquery(
+            FilmWorkGenre.objects.filter(film_work_id=OuterRef("pk"))
+            .values("genre_id__name")
+            .distinct("genre_id__name")
+            .order_by("genre_id__name")
+        )
+
+    @staticmethod
+    def _persons(role: str):
+        return ArraySubquery(
+            FilmWorkPerson.objects.filter(film_work_id=OuterRef("pk"), role=role)
+            .values("person_id__full_name")
+            .distinct("person_id__full_name")
+            .order_by("person_id__full_name")
         )
 
     @classmethod
     def get_queryset(cls):
-        return FilmWork.objects.select_related('persons', 'film_genres').annotate(
-            genres=ArrayAgg("film_genres__name", distinct=True),
-            actors=cls._aggregate_person(role=PersonRoleType.ACTOR),
-            directors=cls._aggregate_person(role=PersonRoleType.DIRECTOR),
-            writers=cls._aggregate_person(role=PersonRoleType.WRITER),
+        return FilmWork.objects.annotate(
+            genres=cls._genres(),
+            actors=cls._persons(role=PersonRoleType.ACTOR),
+            directors=cls._persons(role=PersonRoleType.DIRECTOR),
+            writers=cls._persons(role=PersonRoleType.WRITER),
         ).values()
 
     @staticmethod
     def render_to_response(context, **response_kwargs):
-        return JsonResponse(context)
+        return render_json(context)
 
 
 class MoviesListApi(MoviesApiMixin, BaseListView):
     paginate_by = 50
-    ordering = "title"
+    ordering = ("title", "id")
 
     def get_context_data(self, *, object_list=None, **kwargs):
-        paginator, page, queryset, is_paginated = self.paginate_queryset(
-            self.get_queryset(), self.paginate_by
-        )
+        queryset = self.get_queryset().order_by(*self.ordering)
+        # ?cursor= включает постраничный вывод по ключу (title, id):
+        # первая страница — с пустым значением, дальше — токены next/prev.
+        if "cursor" in self.request.GET:
+            count = cached_count("api.v1.movies.count", FilmWork.objects.all())
+            return {
+                "count": count,
+                "total_pages": max(ceil(count / self.paginate_by), 1),
+                **paginate_by_cursor(queryset, self.request.GET["cursor"], self.paginate_by),
+            }
+
+        paginator, page, queryset, is_paginated = self.paginate_queryset(queryset, self.paginate_by)
         return {
             "count": paginator.count,
             "total_pages": paginator.num_pages,
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'movies',
+    'api',
 ]
 
 MIDDLEWARE = [
@@ -135,4 +136,30 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-TIME_ZONE = 'UTC'
\ No newline at end of file
+TIME_ZONE = 'UTC'
+# json | orjson, по умолчанию orjson, если установлен
+JSON_BACKEND = os.environ.get('JSON_BACKEND')
+# Сколько секунд кешируется общее количество фильмов в курсорной пагинации
+MOVIES_COUNT_CACHE_SECONDS = int(os.environ.get('MOVIES_COUNT_CACHE_SECONDS', 300))
+
+# Кеш ответов API: file — каталог, общий для воркеров gunicorn; locmem — в памяти процесса,
+# сигналы сбрасывают его только в том воркере, который принял запись, поэтому годится
+# только для одного процесса (runserver).
+API_CACHE = 'api'
+API_CACHE_SECONDS = int(os.environ.get('API_CACHE_SECONDS', 600))
+API_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    API_CACHE: {
+        'BACKEND': API_CACHE_BACKENDS[os.environ.get('API_CACHE_BACKEND', 'file')],
+        'LOCATION': os.environ.get('API_CACHE_LOCATION', os.path.join(BASE_DIR, 'api_cache')),
+        'TIMEOUT': API_CACHE_SECONDS,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
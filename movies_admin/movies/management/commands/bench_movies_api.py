@@ -0,0 +1,135 @@
+"""
+Бенчмарк API фильмов на синтетическом каталоге: число запросов и задержки
+списка и карточки фильма для прежнего ArrayAgg по соединению связей и для
+коррелированных подзапросов. Каталог создаётся в транзакции и по окончании
+откатывается. --keep сохраняет его, но только в отдельной базе, заданной
+алиасом --database, а не в рабочей `default`.
+
+    python manage.py bench_movies_api --films 50000 --persons-per-film 20
+"""
+import random
+import uuid
+from time import perf_counter
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+
+from api.v1.views import MoviesApiMixin
+from movies.models import FilmWork, FilmWorkGenre, FilmWorkPerson, FilmWorkType, Genre, Person, PersonRoleType
+
+BATCH_SIZE = 5000
+PERCENTILES = (50, 95, 99)
+
+
+def aggregate_queryset():
+    """Прежний вариант: ArrayAgg(distinct) по соединению жанров и людей"""
+
+    def aggregate_person(role):
+        return ArrayAgg('filmworkperson__person_id__full_name', filter=Q(filmworkperson__role=role), distinct=True)
+
+    return FilmWork.objects.annotate(
+        genres=ArrayAgg('film_genres__name', distinct=True),
+        actors=aggregate_person(PersonRoleType.ACTOR),
+        directors=aggregate_person(PersonRoleType.DIRECTOR),
+        writers=aggregate_person(PersonRoleType.WRITER),
+    ).values()
+
+
+STRATEGIES = {
+    'aggregate': aggregate_queryset,
+    'subquery': MoviesApiMixin.get_queryset,
+}
+
+
+class Command(BaseCommand):
+    help = 'Query count and latency of the movies API querysets on a synthetic catalogue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--films', type=int, default=20000)
+        parser.add_argument('--genres', type=int, default=100)
+        parser.add_argument('--persons', type=int, default=20000)
+        parser.add_argument('--genres-per-film', type=int, default=3)
+        parser.add_argument('--persons-per-film', type=int, default=12)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='database alias to run against')
+        parser.add_argument(
+            '--keep', action='store_true', help='commit the generated catalogue (not allowed on the default database)'
+        )
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if options['keep'] and using == DEFAULT_DB_ALIAS:
+            raise CommandError('--keep needs a dedicated database: pass --database with an alias other than default')
+        rng = random.Random(options['seed'])
+        with transaction.atomic(using=using):
+            started = perf_counter()
+            film_ids = self.generate(rng, options, using)
+            self.stdout.write(f'catalogue generated in {perf_counter() - started:.1f} s')
+
+            self.stdout.write(f"{'strategy':>10} {'endpoint':>8} {'queries':>8} " + ' '.join(
+                f'{f"p{percentile} ms":>9}' for percentile in PERCENTILES
+            ))
+            for name, queryset in STRATEGIES.items():
+                page = options['page_size']
+                self.report(
+                    name, 'list', options['repeat'], using,
+                    lambda: list(queryset().using(using).order_by('title', 'id')[:page]),
+                )
+                self.report(
+                    name, 'detail', options['repeat'], using,
+                    lambda: queryset().using(using).get(pk=rng.choice(film_ids)),
+                )
+
+            if not options['keep']:
+                transaction.set_rollback(True, using=using)
+
+    def report(self, strategy, endpoint, repeat, using, call):
+        samples = []
+        queries = 0
+        for _ in range(repeat):
+            with CaptureQueriesContext(connections[using]) as captured:
+                started = perf_counter()
+                call()
+                samples.append(perf_counter() - started)
+            queries = len(captured)
+        samples.sort()
+        self.stdout.write(f'{strategy:>10} {endpoint:>8} {queries:>8} ' + ' '.join(
+            f'{1000 * samples[min(len(samples) - 1, len(samples) * percentile // 100)]:>9.2f}'
+            for percentile in PERCENTILES
+        ))
+
+    @staticmethod
+    def generate(rng, options, using):
+        """Жанры, люди, фильмы и связи пачками bulk_create; возвращает id фильмов"""
+        genres = [Genre(name=f'Genre {number}') for number in range(options['genres'])]
+        persons = [Person(full_name=f'Person {number}') for number in range(options['persons'])]
+        films = [
+            FilmWork(
+                id=uuid.UUID(int=rng.getrandbits(128)),
+                title=f'Film {number:08d}',
+                rating=round(rng.uniform(0, 10), 1),
+                type=rng.choice(FilmWorkType.values),
+            )
+            for number in range(options['films'])
+        ]
+        Genre.objects.using(using).bulk_create(genres, batch_size=BATCH_SIZE)
+        Person.objects.using(using).bulk_create(persons, batch_size=BATCH_SIZE)
+        FilmWork.objects.using(using).bulk_create(films, batch_size=BATCH_SIZE)
+
+        genre_links = []
+        person_links = []
+        for film in films:
+            for genre in rng.sample(genres, min(options['genres_per_film'], len(genres))):
+                genre_links.append(FilmWorkGenre(film_work_id=film, genre_id=genre))
+            for person in rng.sample(persons, min(options['persons_per_film'], len(persons))):
+                person_links.append(
+                    FilmWorkPerson(film_work_id=film, person_id=person, role=rng.choice(PersonRoleType.values))
+                )
+        FilmWorkGenre.objects.using(using).bulk_create(genre_links, batch_size=BATCH_SIZE)
+        FilmWorkPerson.objects.using(using).bulk_create(person_links, batch_size=BATCH_SIZE)
+        return [film.id for film in films]
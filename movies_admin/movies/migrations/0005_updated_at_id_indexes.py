@@ -0,0 +1,25 @@
+# Generated by Django 3.2 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_alter_filmwork_rating'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='genre',
+            index=models.Index(fields=['updated_at', 'id'], name='genre_updated_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['updated_at', 'id'], name='person_updated_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmwork',
+            index=models.Index(fields=['updated_at', 'id'], name='film_work_updated_at_id_idx'),
+        ),
+    ]
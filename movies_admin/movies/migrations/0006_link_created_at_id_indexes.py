@@ -0,0 +1,21 @@
+# Generated by Django 3.2 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_updated_at_id_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filmworkgenre',
+            index=models.Index(fields=['created_at', 'id'], name='genre_film_work_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmworkperson',
+            index=models.Index(fields=['created_at', 'id'], name='person_film_work_created_idx'),
+        ),
+    ]
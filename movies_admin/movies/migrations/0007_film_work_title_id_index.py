@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_link_created_at_id_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filmwork',
+            index=models.Index(fields=['title', 'id'], name='film_work_title_id_idx'),
+        ),
+    ]
@@ -22,6 +22,9 @@ class Genre(TimeStampedModel):
         verbose_name = _('Genre')
         verbose_name_plural = _('Genres')
         db_table = 'content\".\"genre'
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='genre_updated_at_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -36,6 +39,9 @@ class Person(TimeStampedModel):
         verbose_name = _('Person')
         verbose_name_plural = _('Persons')
         db_table = 'content\".\"person'
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='person_updated_at_id_idx'),
+        ]
 
     def __str__(self):
         return self.full_name
@@ -74,6 +80,10 @@ class FilmWork(TimeStampedModel):
         verbose_name = _('Film')
         verbose_name_plural = _('Films')
         db_table = 'content\".\"film_work'
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='film_work_updated_at_id_idx'),
+            models.Index(fields=['title', 'id'], name='film_work_title_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -89,6 +99,7 @@ class FilmWorkGenre(models.Model):
         db_table = 'content\".\"genre_film_work'
         indexes = [
             models.Index(fields=['film_work_id', 'genre_id'], name='id_genre_film_work_index'),
+            models.Index(fields=['created_at', 'id'], name='genre_film_work_created_idx'),
         ]
         verbose_name = "Genres of film"
         verbose_name_plural = _('Genres of film')
@@ -109,6 +120,7 @@ class FilmWorkPerson(models.Model):
         db_table = 'content\".\"person_film_work'
         indexes = [
             models.Index(fields=['film_work_id', 'person_id', 'role'], name='id_person_role_index'),
+            models.Index(fields=['created_at', 'id'], name='person_film_work_created_idx'),
         ]
         unique_together = ('film_work_id', 'person_id', 'role', )
         verbose_name = "Persons of film"
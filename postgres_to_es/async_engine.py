@@ -0,0 +1,313 @@
+import asyncio
+import itertools
+import logging
+import os
+import signal
+from time import monotonic, time
+
+import backoff
+from elasticsearch.exceptions import ElasticsearchException
+
+import metrics
+from bulk import BulkRetryError, encode_body, encode_meta, split_results
+from etl import BatchTransform
+from producer import get_watermark, page_watermark
+from serializers import ESSerializer
+from state import State
+
+try:
+    import psycopg
+    from elasticsearch import AsyncElasticsearch
+    from psycopg.rows import dict_row
+except ImportError:  # pragma: no cover
+    psycopg = None
+
+# Маркер конца потока данных в очередях между стадиями.
+DONE = object()
+
+
+class AsyncIndexPipeline:
+    """
+    Асинхронный конвейер одного индекса: извлечение, преобразование и загрузка
+    работают одновременно и связаны ограниченными очередями, а в ES
+    одновременно отправляется до `concurrency` запросов `_bulk`.
+    Состояние сохраняется строго по порядку подтверждения пачек.
+    """
+
+    def __init__(
+        self,
+        conn,
+        es,
+        state: State,
+        query,
+        batch_size: int = 100,
+        itersize: int = 2000,
+        queue_size: int = 8,
+        concurrency: int = 4,
+        chunk_size: int = 500,
+        max_chunk_bytes: int = 10 * 1024 * 1024,
+        max_retries: int = 3,
+    ) -> None:
+        self.conn = conn
+        self.es = es
+        self.state = state
+        self.query = query
+        self.batch_size = batch_size
+        self.itersize = itersize
+        self.queue_size = queue_size
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_retries = max_retries
+
+    async def run_cycle(self) -> int:
+        """Один цикл ETL индекса, возвращает количество обработанных документов"""
+        started_at = time()
+        rows = asyncio.Queue(maxsize=self.queue_size)
+        docs = asyncio.Queue(maxsize=self.queue_size)
+        tasks = [
+            asyncio.create_task(self._extract(rows)),
+            asyncio.create_task(self._transform(rows, docs)),
+            asyncio.create_task(self._load(docs)),
+        ]
+        try:
+            processed, _, _ = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        metrics.cycle_finished(self.query["index"], started_at)
+        return processed
+
+    async def _extract(self, out: asyncio.Queue) -> int:
+        processed = 0
+        for source in self.query["sources"]:
+            state_key = f"{self.query['index']}_{source['table']}"
+            watermark = get_watermark(self.state, self.query, source)
+            while page := await self._fetch_changes(source, watermark):
+                ids = [row["id"] for row in page]
+                if source.get("resolve") is not None:
+                    with metrics.stage(self.query["index"], "resolve"):
+                        ids = [row["id"] for row in await self._fetch(source["resolve"], {"ids": ids})]
+                # Как в ChangeProducer, повторы убираются только внутри страницы.
+                fresh = list(dict.fromkeys(ids))
+                if fresh:
+                    await self._enrich(fresh, out)
+                processed += len(fresh)
+                watermark = page_watermark(page)
+                await out.put(([], {state_key: watermark}))
+                if len(page) < self.batch_size:
+                    break
+        await out.put(DONE)
+        return processed
+
+    async def _fetch_changes(self, source, watermark: dict) -> list:
+        with metrics.stage(self.query["index"], "query"):
+            return await self._fetch(source["query"], {**watermark, "limit": self.batch_size})
+
+    @backoff.on_exception(wait_gen=backoff.expo, exception=psycopg.OperationalError if psycopg else Exception)
+    async def _fetch(self, sql: str, params: dict) -> list:
+        async with self.conn.cursor() as cursor:
+            await cursor.execute(sql, params)
+            return await cursor.fetchall()
+
+    async def _enrich(self, ids: list, out: asyncio.Queue) -> None:
+        index = self.query["index"]
+        async with self.conn.transaction():
+            async with self.conn.cursor(name=f"etl_{index}") as cursor:
+                with metrics.stage(index, "query"):
+                    await cursor.execute(self.query["query"], {"ids": ids})
+                while True:
+                    with metrics.stage(index, "fetch"):
+                        batch = await cursor.fetchmany(self.itersize)
+                    if not batch:
+                        break
+                    metrics.ROWS.inc(len(batch), index=index)
+                    await out.put((batch, {}))
+
+    async def _transform(self, rows: asyncio.Queue, out: asyncio.Queue) -> None:
+        transform = BatchTransform(self.query, fast_path=os.environ.get("TRANSFORM_FAST_PATH", "1") == "1")
+        while (item := await rows.get()) is not DONE:
+            batch, checkpoint = item
+            with metrics.stage(self.query["index"], "transform"):
+                actions = [
+                    (encode_meta(self.query["index"], doc_id), source)
+                    for doc_id, source in transform.transform(batch)
+                ]
+            await out.put((actions, checkpoint))
+        await out.put(DONE)
+
+    async def _load(self, docs: asyncio.Queue) -> None:
+        started = monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        in_flight = set()
+        sequence = itertools.count()
+        acknowledged = {}
+        next_commit = 0
+        errors = []
+        stats = {"indexed": 0, "failed": 0}
+
+        async def send(seq: int, actions: list, checkpoint: dict) -> None:
+            nonlocal next_commit
+            try:
+                if actions:
+                    indexed, failed = await self._send_chunk(actions)
+                    stats["indexed"] += indexed
+                    stats["failed"] += failed
+            except Exception as error:
+                # Ошибка поднимается из _load, задача завершается без исключения.
+                errors.append(error)
+                return
+            finally:
+                semaphore.release()
+            # Состояние сохраняется только когда подтверждены все предыдущие пачки.
+            acknowledged[seq] = checkpoint
+            while next_commit in acknowledged:
+                updates = acknowledged.pop(next_commit)
+                if updates:
+                    with metrics.stage(self.query["index"], "checkpoint"):
+                        self.state.update(updates)
+                next_commit += 1
+
+        async def flush(actions: list, checkpoint: dict) -> None:
+            await semaphore.acquire()
+            if errors:
+                semaphore.release()
+                raise errors[0]
+            task = asyncio.create_task(send(next(sequence), actions, checkpoint))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        buffer, size, checkpoint = [], 0, {}
+        try:
+            while (item := await docs.get()) is not DONE:
+                actions, updates = item
+                for action in actions:
+                    action_size = len(action[0]) + len(action[1]) + 2
+                    if buffer and size + action_size > self.max_chunk_bytes:
+                        await flush(buffer, checkpoint)
+                        buffer, size, checkpoint = [], 0, {}
+                    buffer.append(action)
+                    size += action_size
+                    if len(buffer) >= self.chunk_size:
+                        await flush(buffer, checkpoint)
+                        buffer, size, checkpoint = [], 0, {}
+                checkpoint.update(updates)
+            if buffer or checkpoint:
+                await flush(buffer, checkpoint)
+            if in_flight:
+                await asyncio.gather(*in_flight)
+            if errors:
+                raise errors[0]
+        except BaseException:
+            for task in in_flight:
+                task.cancel()
+            raise
+
+        elapsed = monotonic() - started
+        if stats["indexed"] or stats["failed"]:
+            logging.info(
+                "%s: %s indexed, %s failed, %.1f docs/sec.",
+                self.query["index"],
+                stats["indexed"],
+                stats["failed"],
+                stats["indexed"] / elapsed if elapsed else 0.0,
+            )
+
+    async def _send_chunk(self, actions: list) -> tuple[int, int]:
+        indexed = failed = 0
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                logging.warning("Retrying %s rejected documents.", len(actions))
+                await asyncio.sleep(2 ** (attempt - 1))
+            items = await self._bulk(actions)
+            accepted, rejected, retry = split_results(actions, items)
+            indexed += len(accepted)
+            failed += rejected
+            metrics.DOCUMENTS.inc(len(accepted), index=self.query["index"], result="indexed")
+            metrics.DOCUMENTS.inc(rejected, index=self.query["index"], result="failed")
+            if not retry:
+                break
+            actions = retry
+        if retry:
+            # Пачка не подтверждается, и состояние за ней не сохраняется.
+            raise BulkRetryError(f"{len(retry)} documents still rejected after {self.max_retries} retries.")
+        return indexed, failed
+
+    @backoff.on_exception(wait_gen=backoff.expo, exception=ElasticsearchException, max_tries=10)
+    async def _bulk(self, actions: list) -> list[dict]:
+        with metrics.stage(self.query["index"], "bulk"):
+            response = await self.es.bulk(body=encode_body(actions))
+        return response["items"]
+
+
+async def run_index(pipeline: AsyncIndexPipeline, stop: asyncio.Event, interval: float, max_interval: float) -> None:
+    """Запускать цикл индекса по расписанию с адаптивной паузой, как `scheduler.IndexWorker`"""
+    delay = interval
+    while not stop.is_set():
+        try:
+            processed = await pipeline.run_cycle()
+        except Exception:
+            logging.exception("%s: ETL cycle failed.", pipeline.query["index"])
+            metrics.CYCLES.inc(index=pipeline.query["index"], outcome="failure")
+            processed = 0
+        delay = interval if processed else min(delay * 2, max_interval)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(dsn: dict, state: State, queries) -> None:
+    """Асинхронный движок ETL: по конвейеру и соединению PostgreSQL на индекс, общий клиент ES"""
+    if psycopg is None:
+        raise RuntimeError("Async engine requires psycopg>=3 and elasticsearch[async] (aiohttp).")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    es = AsyncElasticsearch(
+        [os.environ.get("ES_HOST")],
+        maxsize=int(os.environ.get("ES_MAXSIZE", 10)),
+        timeout=30,
+        retry_on_timeout=True,
+        serializer=ESSerializer(),
+    )
+    connections = []
+    try:
+        runners = []
+        for query in queries:
+            conn = await psycopg.AsyncConnection.connect(**dsn, autocommit=True, row_factory=dict_row)
+            connections.append(conn)
+            pipeline = AsyncIndexPipeline(
+                conn,
+                es,
+                state,
+                query,
+                batch_size=int(os.environ.get("BATCH_SIZE", 100)),
+                itersize=int(os.environ.get("ITERSIZE", os.environ.get("BATCH_SIZE", 2000))),
+                queue_size=int(os.environ.get("QUEUE_SIZE", 8)),
+                concurrency=int(os.environ.get("BULK_CONCURRENCY", 4)),
+                chunk_size=int(os.environ.get("BULK_CHUNK_SIZE", 500)),
+                max_chunk_bytes=int(os.environ.get("BULK_MAX_BYTES", 10 * 1024 * 1024)),
+                max_retries=int(os.environ.get("BULK_MAX_RETRIES", 3)),
+            )
+            index = query["index"].upper()
+            runners.append(
+                run_index(
+                    pipeline,
+                    stop,
+                    interval=float(os.environ.get(f"POLL_INTERVAL_{index}", os.environ.get("POLL_INTERVAL", 1))),
+                    max_interval=float(
+                        os.environ.get(f"POLL_MAX_INTERVAL_{index}", os.environ.get("POLL_MAX_INTERVAL", 60))
+                    ),
+                )
+            )
+        logging.info("Async ETL engine started.")
+        await asyncio.gather(*runners)
+    finally:
+        for conn in connections:
+            await conn.close()
+        await es.close()
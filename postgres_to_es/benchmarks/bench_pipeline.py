@@ -0,0 +1,176 @@
+"""
+Сквозной бенчмарк ETL: изменения → извлечение → преобразование → загрузка
+на локальном PostgreSQL и заглушке ES. Выводит документы в секунду,
+перцентили задержек стадий и пиковый объём памяти. Результат можно
+сохранить и сравнивать с ним следующие прогоны.
+
+    export BENCH_POSTGRES_DB=movies_bench
+    python benchmarks/catalogue.py --force --films 20000
+    python benchmarks/bench_pipeline.py --save baseline.json
+    python benchmarks/bench_pipeline.py --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from collections import defaultdict
+from contextlib import closing, contextmanager
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2  # noqa: E402
+from dotenv import load_dotenv  # noqa: E402
+from psycopg2.extras import RealDictCursor  # noqa: E402
+
+import stub_es  # noqa: E402
+from bulk import BulkLoader  # noqa: E402
+from catalogue import dsn_from_env  # noqa: E402
+from context import PipelineContext, peak_rss_kb, reset_peak_rss  # noqa: E402
+from etl import BatchTransform, Extraction, Load, Transform  # noqa: E402
+from producer import ChangeProducer  # noqa: E402
+from queries import queries  # noqa: E402
+from state import JsonFileStorage, State  # noqa: E402
+
+PERCENTILES = (50, 95, 99)
+
+
+class Timings:
+    """Длительности отдельных вызовов по стадиям"""
+
+    def __init__(self) -> None:
+        self.samples = defaultdict(list)
+
+    @contextmanager
+    def measure(self, stage: str):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[stage].append(perf_counter() - started)
+
+    def iterate(self, stage: str, iterator):
+        """Отдавать элементы итератора, засекая время получения каждого"""
+        iterator = iter(iterator)
+        while True:
+            with self.measure(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def summary(self) -> dict:
+        result = {}
+        for stage, samples in self.samples.items():
+            ordered = sorted(samples)
+            result[stage] = {
+                "calls": len(ordered),
+                "total_s": sum(ordered),
+                **{
+                    f"p{percentile}_ms": 1000 * ordered[min(len(ordered) - 1, len(ordered) * percentile // 100)]
+                    for percentile in PERCENTILES
+                },
+            }
+        return result
+
+
+def run_index(dsn: dict, es_host: str, query, bulk_mode: bool) -> dict:
+    """Загрузить индекс с нуля и вернуть его метрики"""
+    with tempfile.TemporaryDirectory() as directory:
+        state = State(storage=JsonFileStorage(os.path.join(directory, "state.json")))
+        timings = Timings()
+        documents = 0
+        reset_peak_rss()
+        started = perf_counter()
+        with closing(psycopg2.connect(**dsn, cursor_factory=RealDictCursor)) as pg_conn, PipelineContext(
+            pg_conn, es_host=es_host, itersize=int(os.environ.get("ITERSIZE", 2000))
+        ) as context:
+            extraction = Extraction(context, query)
+            transform = BatchTransform(query, fast_path=os.environ.get("TRANSFORM_FAST_PATH", "1") == "1")
+            loader = BulkLoader(
+                context.es,
+                chunk_size=int(os.environ.get("BULK_CHUNK_SIZE", 500)),
+                max_chunk_bytes=int(os.environ.get("BULK_MAX_BYTES", 10 * 1024 * 1024)),
+                on_checkpoint=state.update,
+            )
+            changes = ChangeProducer(context, query, state).produce()
+            for ids, checkpoint in timings.iterate("changes", changes):
+                for batch in timings.iterate("extract", extraction.extract_batches(ids)):
+                    documents += len(batch)
+                    if not bulk_mode:
+                        for data in batch:
+                            with timings.measure("transform"):
+                                data_obj = Transform(query, data).transform()
+                            with timings.measure("load"):
+                                Load(context, query, data_obj).load_data()
+                        continue
+                    with timings.measure("transform"):
+                        sources = transform.transform(batch)
+                    with timings.measure("load"):
+                        for doc_id, source in sources:
+                            loader.add_raw(query["index"], doc_id, source)
+                with timings.measure("checkpoint"):
+                    if bulk_mode:
+                        loader.checkpoint(checkpoint)
+                    else:
+                        state.update(checkpoint)
+            with timings.measure("load"):
+                loader.close()
+            peak_rss = peak_rss_kb()
+        elapsed = perf_counter() - started
+    return {
+        "documents": documents,
+        "elapsed_s": elapsed,
+        "docs_per_sec": documents / elapsed if elapsed else 0.0,
+        "peak_rss_kb": peak_rss,
+        "stages": timings.summary(),
+    }
+
+
+def print_report(results: dict, baseline: dict) -> None:
+    for index, result in results.items():
+        line = f"{index}: {result['documents']} docs in {result['elapsed_s']:.2f} s"
+        line += f", {result['docs_per_sec']:.0f} docs/sec"
+        if index in baseline and baseline[index]["docs_per_sec"]:
+            change = result["docs_per_sec"] / baseline[index]["docs_per_sec"] - 1
+            line += f" ({change:+.1%} vs baseline)"
+        print(f"{line}, peak RSS {result['peak_rss_kb']} KB")
+        header = "".join(f"{f'p{percentile} ms':>10}" for percentile in PERCENTILES)
+        print(f"    {'stage':<12}{'calls':>8}{'total s':>10}{header}")
+        for stage, stats in result["stages"].items():
+            percentiles = "".join(f"{stats[f'p{percentile}_ms']:>10.2f}" for percentile in PERCENTILES)
+            print(f"    {stage:<12}{stats['calls']:>8}{stats['total_s']:>10.2f}{percentiles}")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", action="append", choices=[query["index"] for query in queries])
+    parser.add_argument("--mode", choices=("bulk", "single"), default="bulk")
+    parser.add_argument("--es-host", help="настоящий ES вместо встроенной заглушки")
+    parser.add_argument("--dsn", help="строка подключения к базе бенчмарков вместо BENCH_POSTGRES_*")
+    parser.add_argument("--save", help="сохранить результат в JSON")
+    parser.add_argument("--baseline", help="сравнить с сохранённым результатом")
+    args = parser.parse_args()
+
+    es_host = args.es_host
+    if es_host is None:
+        server, _ = stub_es.start()
+        es_host = f"http://127.0.0.1:{server.server_port}"
+
+    results = {
+        query["index"]: run_index(dsn_from_env(args.dsn), es_host, query, bulk_mode=args.mode == "bulk")
+        for query in queries
+        if not args.index or query["index"] in args.index
+    }
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,45 @@
+"""
+Сравнение бэкендов сериализации на документах индекса movies.
+
+    python benchmarks/bench_serializers.py --docs 50000
+"""
+import argparse
+import os
+import sys
+import uuid
+from datetime import datetime, timezone
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_transform import movie_row  # noqa: E402
+from serializers import BACKENDS, orjson  # noqa: E402
+
+
+def movie_doc() -> dict:
+    """Документ с UUID и датами, как в строках psycopg2"""
+    doc = movie_row()
+    doc["id"] = uuid.UUID(doc["id"])
+    doc["created_at"] = doc["updated_at"] = datetime.now(timezone.utc)
+    return doc
+
+
+def measure(dumps, docs: list) -> tuple[float, int]:
+    started = perf_counter()
+    size = sum(len(dumps(doc)) for doc in docs)
+    return perf_counter() - started, size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=50000)
+    args = parser.parse_args()
+
+    docs = [movie_doc() for _ in range(args.docs)]
+    for name, backend in BACKENDS.items():
+        if name == "orjson" and orjson is None:
+            print(f"{name:>8}: not installed")
+            continue
+        elapsed, size = measure(backend.dumps, docs)
+        print(f"{name:>8}: {args.docs / elapsed:12.0f} docs/sec, {size / elapsed / 2 ** 20:8.1f} MB/sec")
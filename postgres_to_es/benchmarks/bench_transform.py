@@ -0,0 +1,61 @@
+"""
+Сравнение скорости BatchTransform: быстрый путь без модели и валидация pydantic.
+
+    python benchmarks/bench_transform.py --rows 50000 --batch 500
+"""
+import argparse
+import os
+import random
+import sys
+import uuid
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from etl import BatchTransform  # noqa: E402
+from queries import queries  # noqa: E402
+
+
+def person() -> dict:
+    return {"id": str(uuid.uuid4()), "name": f"Person {random.randint(1, 10 ** 6)}"}
+
+
+def movie_row() -> dict:
+    """Строка в том виде, в каком её возвращает запрос обогащения индекса movies"""
+    actors = [person() for _ in range(random.randint(0, 8))]
+    writers = [person() for _ in range(random.randint(0, 3))]
+    return {
+        "id": str(uuid.uuid4()),
+        "title": f"Film {random.randint(1, 10 ** 6)}",
+        "type": "movie",
+        "description": "Lorem ipsum dolor sit amet. " * random.randint(1, 10),
+        "imdb_rating": round(random.uniform(0, 10), 1),
+        "genre": [{"id": str(uuid.uuid4()), "name": "Action"} for _ in range(random.randint(1, 3))],
+        "actors_names": [actor["name"] for actor in actors],
+        "writers_names": [writer["name"] for writer in writers],
+        "director": person() if random.random() > 0.1 else None,
+        "actors": actors,
+        "writers": writers,
+    }
+
+
+def measure(transform: BatchTransform, batches: list) -> float:
+    started = perf_counter()
+    for batch in batches:
+        transform.transform(batch)
+    return perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    query = next(query for query in queries if query["index"] == "movies")
+    rows = [movie_row() for _ in range(args.rows)]
+    batches = [rows[start:start + args.batch] for start in range(0, len(rows), args.batch)]
+
+    for name, fast_path in (("pydantic", False), ("fast path", True)):
+        elapsed = measure(BatchTransform(query, fast_path=fast_path), batches)
+        print(f"{name:>10}: {args.rows / elapsed:12.0f} rows/sec ({elapsed:.3f} s)")
@@ -0,0 +1,256 @@
+"""
+Генератор синтетического каталога в схеме `content` локального PostgreSQL
+для бенчмарков ETL. Таблицы повторяют схему movies_admin, объём и
+связность задаются параметрами.
+
+Схема `content` пересоздаётся, поэтому каталог пишется только в отдельную
+базу BENCH_POSTGRES_DB (или --dsn), только с --force и только если в ней
+нет данных, созданных не этим генератором.
+
+    BENCH_POSTGRES_DB=movies_bench python benchmarks/catalogue.py --force \
+        --films 100000 --persons 50000 --genres 30 --genres-per-film 3 --persons-per-film 12
+"""
+import argparse
+import io
+import os
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from typing import Optional
+
+import psycopg2
+from dotenv import load_dotenv
+
+# Таблица-отметка: схему с ней можно пересоздавать, она создана генератором.
+MARKER = "content.benchmark_catalogue"
+
+SCHEMA = f"""
+    DROP SCHEMA IF EXISTS content CASCADE;
+    CREATE SCHEMA content;
+    CREATE TABLE {MARKER} (generated_at timestamptz NOT NULL DEFAULT now());
+    INSERT INTO {MARKER} DEFAULT VALUES;
+    CREATE TABLE content.genre (
+        id uuid PRIMARY KEY,
+        name varchar(25) NOT NULL,
+        description text,
+        created_at timestamptz NOT NULL,
+        updated_at timestamptz NOT NULL
+    );
+    CREATE TABLE content.person (
+        id uuid PRIMARY KEY,
+        full_name varchar(128) NOT NULL,
+        birth_date date,
+        created_at timestamptz NOT NULL,
+        updated_at timestamptz NOT NULL
+    );
+    CREATE TABLE content.film_work (
+        id uuid PRIMARY KEY,
+        title varchar(128) NOT NULL,
+        description text,
+        creation_date date,
+        certificate text,
+        file_path varchar(100),
+        rating double precision,
+        type varchar(20) NOT NULL,
+        created_at timestamptz NOT NULL,
+        updated_at timestamptz NOT NULL
+    );
+    CREATE TABLE content.genre_film_work (
+        id uuid PRIMARY KEY,
+        film_work_id uuid NOT NULL REFERENCES content.film_work (id) DEFERRABLE INITIALLY DEFERRED,
+        genre_id uuid NOT NULL REFERENCES content.genre (id) DEFERRABLE INITIALLY DEFERRED,
+        created_at timestamptz NOT NULL,
+        UNIQUE (film_work_id, genre_id)
+    );
+    CREATE TABLE content.person_film_work (
+        id uuid PRIMARY KEY,
+        film_work_id uuid NOT NULL REFERENCES content.film_work (id) DEFERRABLE INITIALLY DEFERRED,
+        person_id uuid NOT NULL REFERENCES content.person (id) DEFERRABLE INITIALLY DEFERRED,
+        role varchar(15) NOT NULL,
+        created_at timestamptz NOT NULL,
+        UNIQUE (film_work_id, person_id, role)
+    );
+"""
+
+# Индексы создаются после заливки данных, так COPY работает быстрее.
+INDEXES = """
+    CREATE INDEX genre_updated_at_id_idx ON content.genre (updated_at, id);
+    CREATE INDEX person_updated_at_id_idx ON content.person (updated_at, id);
+    CREATE INDEX film_work_updated_at_id_idx ON content.film_work (updated_at, id);
+    CREATE INDEX genre_film_work_genre_id_idx ON content.genre_film_work (genre_id);
+    CREATE INDEX genre_film_work_created_idx ON content.genre_film_work (created_at, id);
+    CREATE INDEX person_film_work_person_id_idx ON content.person_film_work (person_id);
+    CREATE INDEX person_film_work_created_idx ON content.person_film_work (created_at, id);
+    ANALYZE;
+"""
+
+ROLES = ("actor", "director", "writer")
+EPOCH = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+
+def dsn_from_env(dsn: Optional[str] = None) -> dict:
+    """
+    Параметры подключения к базе бенчмарков: строка `dsn` или BENCH_POSTGRES_*.
+    Рабочая база POSTGRES_DB не используется никогда, от POSTGRES_* берутся
+    только пользователь, пароль, хост и порт, если BENCH_* для них не заданы
+    """
+    if dsn:
+        return {"dsn": dsn}
+    dbname = os.environ.get("BENCH_POSTGRES_DB")
+    if not dbname:
+        raise SystemExit("Set BENCH_POSTGRES_DB or pass --dsn: benchmarks never run against POSTGRES_DB.")
+    if dbname == os.environ.get("POSTGRES_DB"):
+        raise SystemExit("BENCH_POSTGRES_DB must differ from POSTGRES_DB.")
+    return {
+        "dbname": dbname,
+        **{
+            option: os.environ.get(f"BENCH_POSTGRES_{option.upper()}", os.environ.get(f"POSTGRES_{option.upper()}"))
+            for option in ("user", "password", "host", "port")
+        },
+    }
+
+
+def check_disposable(cursor) -> None:
+    """Отказаться пересоздавать `content`, если в схеме есть данные не от генератора"""
+    cursor.execute("SELECT to_regclass(%s), to_regclass('content.film_work');", (MARKER,))
+    marker, film_work = cursor.fetchone()
+    if marker is not None or film_work is None:
+        return
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM content.film_work);")
+    if cursor.fetchone()[0]:
+        raise SystemExit("Schema content already holds a catalogue that was not generated here, refusing to drop it.")
+
+
+class Catalogue:
+    """Детерминированный (при одном `seed`) генератор строк таблиц каталога"""
+
+    def __init__(
+        self,
+        films: int,
+        persons: int,
+        genres: int,
+        genres_per_film: int,
+        persons_per_film: int,
+        seed: int = 0,
+    ) -> None:
+        self.random = random.Random(seed)
+        self.films = films
+        self.persons = persons
+        self.genres = genres
+        self.genres_per_film = min(genres_per_film, genres)
+        self.persons_per_film = min(persons_per_film, persons)
+        self.genre_ids = [self._uuid() for _ in range(genres)]
+        self.person_ids = [self._uuid() for _ in range(persons)]
+
+    def _uuid(self) -> str:
+        return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    def _timestamp(self) -> str:
+        return (EPOCH + timedelta(seconds=self.random.randrange(365 * 24 * 3600))).isoformat()
+
+    def genre_rows(self):
+        for number, genre_id in enumerate(self.genre_ids):
+            stamp = self._timestamp()
+            yield genre_id, f"Genre {number}", None, stamp, stamp
+
+    def person_rows(self):
+        for number, person_id in enumerate(self.person_ids):
+            stamp = self._timestamp()
+            yield person_id, f"Person {number}", None, stamp, stamp
+
+    def film_rows(self):
+        """Фильмы вместе со связями: (film_work, [genre_film_work], [person_film_work])"""
+        for number in range(self.films):
+            film_id = self._uuid()
+            stamp = self._timestamp()
+            film = (
+                film_id,
+                f"Film {number}",
+                "Lorem ipsum dolor sit amet. " * self.random.randint(1, 10),
+                None,
+                None,
+                None,
+                round(self.random.uniform(0, 10), 1),
+                "movie" if self.random.random() > 0.2 else "tv_show",
+                stamp,
+                stamp,
+            )
+            genres = [
+                (self._uuid(), film_id, genre_id, stamp)
+                for genre_id in self.random.sample(self.genre_ids, self.genres_per_film)
+            ]
+            persons = [
+                (self._uuid(), film_id, person_id, self.random.choice(ROLES), stamp)
+                for person_id in self.random.sample(self.person_ids, self.persons_per_film)
+            ]
+            yield film, genres, persons
+
+
+def copy_rows(cursor, table: str, rows, chunk: int = 10000) -> int:
+    """Залить строки в таблицу через COPY порциями по `chunk` строк"""
+    count = 0
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(r"\N" if value is None else str(value) for value in row))
+        buffer.write("\n")
+        count += 1
+        if count % chunk == 0:
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY content.{table} FROM STDIN", buffer)
+            buffer = io.StringIO()
+    if buffer.tell():
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY content.{table} FROM STDIN", buffer)
+    return count
+
+
+def generate(pg_conn, catalogue: Catalogue) -> dict:
+    """Пересоздать схему `content` и заполнить её, вернуть количество строк по таблицам"""
+    counts = {}
+    with pg_conn, pg_conn.cursor() as cursor:
+        check_disposable(cursor)
+        cursor.execute(SCHEMA)
+        counts["genre"] = copy_rows(cursor, "genre", catalogue.genre_rows())
+        counts["person"] = copy_rows(cursor, "person", catalogue.person_rows())
+
+        links = {"genre_film_work": [], "person_film_work": []}
+
+        def films():
+            for film, genres, persons in catalogue.film_rows():
+                links["genre_film_work"] += genres
+                links["person_film_work"] += persons
+                yield film
+
+        counts["film_work"] = copy_rows(cursor, "film_work", films())
+        for table, rows in links.items():
+            counts[table] = copy_rows(cursor, table, rows)
+        cursor.execute(INDEXES)
+    return counts
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--films", type=int, default=10000)
+    parser.add_argument("--persons", type=int, default=5000)
+    parser.add_argument("--genres", type=int, default=30)
+    parser.add_argument("--genres-per-film", type=int, default=3)
+    parser.add_argument("--persons-per-film", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dsn", help="строка подключения к базе бенчмарков вместо BENCH_POSTGRES_*")
+    parser.add_argument("--force", action="store_true", help="подтвердить пересоздание схемы content")
+    args = parser.parse_args()
+    if not args.force:
+        parser.error("the content schema is dropped and recreated, pass --force to confirm")
+
+    started = perf_counter()
+    with psycopg2.connect(**dsn_from_env(args.dsn)) as pg_conn:
+        counts = generate(
+            pg_conn,
+            Catalogue(args.films, args.persons, args.genres, args.genres_per_film, args.persons_per_film, args.seed),
+        )
+    pg_conn.close()
+    for table, count in counts.items():
+        print(f"{table:>16}: {count} rows")
+    print(f"Generated in {perf_counter() - started:.1f} s.")
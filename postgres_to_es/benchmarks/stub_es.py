@@ -0,0 +1,113 @@
+"""
+Заглушка Elasticsearch для бенчмарков: отвечает на `GET /`, `_bulk` и
+индексацию отдельного документа, ничего не храня. Считает принятые
+документы и байты тела запросов.
+
+    python benchmarks/stub_es.py --port 9201
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+INFO = {
+    "name": "stub",
+    "cluster_name": "benchmark",
+    "version": {"number": "7.10.2", "build_flavor": "default", "lucene_version": "8.7.0"},
+    "tagline": "You Know, for Search",
+}
+
+
+class StubStats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.docs = 0
+        self.bytes = 0
+
+    def add(self, docs: int, size: int) -> None:
+        with self.lock:
+            self.requests += 1
+            self.docs += docs
+            self.bytes += size
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stats: StubStats
+
+    def do_GET(self) -> None:
+        self._read_body()
+        self._reply(200, INFO if self.path.split("?")[0] == "/" else {})
+
+    def do_HEAD(self) -> None:
+        self._reply(200, None)
+
+    def do_POST(self) -> None:
+        body = self._read_body()
+        path = self.path.split("?")[0].strip("/").split("/")
+        if path[-1] == "_bulk":
+            self._reply(200, self._bulk(body))
+        elif len(path) >= 2 and not path[-1].startswith("_"):
+            # PUT/POST /{index}/{type}/{id}
+            self.stats.add(1, len(body))
+            self._reply(201, {"_index": path[0], "_type": path[1], "_id": path[-1], "result": "created"})
+        else:
+            self._reply(200, {"acknowledged": True})
+
+    do_PUT = do_POST
+    do_DELETE = do_POST
+
+    def _bulk(self, body: bytes) -> dict:
+        lines = body.splitlines()
+        items = []
+        for meta in lines[::2]:
+            op, params = next(iter(json.loads(meta).items()))
+            items.append({op: {"_index": params.get("_index"), "_id": params.get("_id"), "status": 201}})
+        self.stats.add(len(items), len(body))
+        return {"took": 0, "errors": False, "items": items}
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _reply(self, status: int, payload) -> None:
+        data = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def make_server(host: str = "127.0.0.1", port: int = 0) -> tuple[ThreadingHTTPServer, StubStats]:
+    stats = StubStats()
+    handler = type("Handler", (StubHandler,), {"stats": stats})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server, stats
+
+
+def start(host: str = "127.0.0.1", port: int = 0) -> tuple[ThreadingHTTPServer, StubStats]:
+    """Запустить заглушку в фоновом потоке, вернуть сервер и его счётчики"""
+    server, stats = make_server(host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9201)
+    args = parser.parse_args()
+
+    server, stats = make_server(args.host, args.port)
+    print(f"Stub Elasticsearch on http://{args.host}:{server.server_port}, Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"{stats.requests} requests, {stats.docs} documents, {stats.bytes} bytes.")
@@ -0,0 +1,200 @@
+import logging
+from time import monotonic, sleep
+from typing import Any, Callable, Optional
+
+import backoff
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import ElasticsearchException
+from urllib3.exceptions import HTTPError
+
+import metrics
+from fingerprints import FingerprintCache
+from serializers import dumps
+
+# Статусы, при которых повторная отправка отдельного документа имеет смысл.
+RETRYABLE_STATUSES = frozenset((429, 502, 503, 504))
+
+
+def encode_meta(index: str, doc_id: Any, doc_type: str = "doc") -> bytes:
+    """Строка метаданных операции `index` в теле `_bulk`"""
+    return dumps({"index": {"_index": index, "_type": doc_type, "_id": str(doc_id)}})
+
+
+def encode_body(actions: list[tuple[bytes, bytes]]) -> bytes:
+    return b"".join(action + b"\n" + source + b"\n" for action, source in actions)
+
+
+class BulkRetryError(Exception):
+    """Документы всё ещё отклоняются по временной причине после всех повторов"""
+
+
+def split_results(actions: list, items: list[dict]) -> tuple[list, int, list]:
+    """
+    Разобрать ответ `_bulk`: принятые операции, количество окончательно
+    отклонённых (4xx) документов и операции, отклонённые по временной
+    причине, которые нужно отправить повторно
+    """
+    accepted, failed, retry = [], 0, []
+    for action, item in zip(actions, items):
+        result = next(iter(item.values()))
+        status = result.get("status", 500)
+        if status < 300:
+            accepted.append(action)
+        elif status in RETRYABLE_STATUSES:
+            retry.append(action)
+        else:
+            failed += 1
+            logging.error("Document %s was rejected: %s", result.get("_id"), result.get("error"))
+    return accepted, failed, retry
+
+
+class BulkLoader:
+    """
+    Буферизует документы и отправляет их в ES через `_bulk` пачками,
+    ограниченными по количеству документов и по размеру тела запроса.
+    Документы, отклонённые ES по временной причине, отправляются повторно
+    без пересылки всей пачки. С кэшем отпечатков `fingerprints` документы,
+    не изменившиеся с прошлой загрузки, в ES не отправляются.
+    """
+
+    def __init__(
+        self,
+        es: Elasticsearch,
+        chunk_size: int = 500,
+        max_chunk_bytes: int = 10 * 1024 * 1024,
+        max_retries: int = 3,
+        doc_type: str = "doc",
+        on_checkpoint: Optional[Callable[[dict], None]] = None,
+        fingerprints: Optional[FingerprintCache] = None,
+        label: str = "bulk",
+    ) -> None:
+        self.es = es
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_retries = max_retries
+        self.doc_type = doc_type
+        self.on_checkpoint = on_checkpoint
+        self.fingerprints = fingerprints
+        # Значение метки `index` в метриках загрузчика.
+        self.label = label
+
+        self._actions: list[tuple[bytes, bytes]] = []
+        self._bytes = 0
+        self._checkpoint: dict = {}
+        # Отпечатки документов буфера по позиции в пачке, сохраняются после подтверждения ES.
+        # Ключ — позиция, а не _id: две версии одного документа в пачке не затирают друг друга.
+        self._pending: dict[int, tuple[str, str, bytes]] = {}
+
+        self.indexed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.elapsed = 0.0
+
+    def add(self, index: str, doc_id: Any, doc: dict) -> None:
+        """Добавить документ в буфер, при переполнении буфера отправить пачку"""
+        self.add_raw(index, doc_id, dumps(doc))
+
+    def add_raw(self, index: str, doc_id: Any, source: bytes) -> None:
+        """Добавить уже сериализованный в JSON документ"""
+        digest = None
+        if self.fingerprints is not None:
+            digest = self.fingerprints.digest(source)
+            if self.fingerprints.is_unchanged(index, doc_id, digest):
+                self.skipped += 1
+                metrics.DOCUMENTS.inc(index=self.label, result="skipped")
+                return
+        action = encode_meta(index, doc_id, self.doc_type)
+        size = len(action) + len(source) + 2
+
+        if self._actions and self._bytes + size > self.max_chunk_bytes:
+            self.flush()
+        # Отпечаток попадает в ту же пачку, что и документ, то есть после сброса предыдущей.
+        if digest is not None:
+            self._pending[len(self._actions)] = (index, str(doc_id), digest)
+        self._actions.append((action, source))
+        self._bytes += size
+        if len(self._actions) >= self.chunk_size:
+            self.flush()
+
+    def checkpoint(self, updates: dict) -> None:
+        """
+        Запомнить состояние, которое нужно сохранить после того,
+        как все добавленные к этому моменту документы будут приняты ES
+        """
+        self._checkpoint.update(updates)
+        if not self._actions:
+            self._commit_checkpoint()
+
+    def flush(self) -> int:
+        """Отправить накопленную пачку, вернуть количество проиндексированных документов"""
+        if not self._actions:
+            return 0
+        chunk, self._actions, self._bytes = self._actions, [], 0
+        pending, self._pending = self._pending, {}
+
+        started = monotonic()
+        indexed = rejected = 0
+        acknowledged = []
+        positions = list(range(len(chunk)))
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                logging.warning("Retrying %s rejected documents.", len(positions))
+                sleep(2 ** (attempt - 1))
+            items = self._send([chunk[position] for position in positions])
+            accepted, failed, retry = split_results(positions, items)
+            indexed += len(accepted)
+            acknowledged += accepted
+            rejected += failed
+            self.failed += failed
+            if not retry:
+                break
+            positions = retry
+
+        self.indexed += indexed
+        self.elapsed += monotonic() - started
+        metrics.DOCUMENTS.inc(indexed, index=self.label, result="indexed")
+        metrics.DOCUMENTS.inc(rejected, index=self.label, result="failed")
+        if self.fingerprints is not None:
+            # В порядке подтверждения: из двух принятых версий документа в ES осталась последняя.
+            self.fingerprints.store(pending[position] for position in acknowledged if position in pending)
+        if retry:
+            # Состояние не сохраняется: цикл завершится ошибкой и будет повторён с прежней отметки.
+            raise BulkRetryError(f"{len(retry)} documents still rejected after {self.max_retries} retries.")
+        self._commit_checkpoint()
+        return indexed
+
+    def close(self) -> None:
+        """Отправить остаток буфера и вывести статистику"""
+        self.flush()
+        logging.info(
+            "Bulk load finished: %s indexed, %s failed, %s unchanged skipped, %.1f docs/sec.",
+            self.indexed,
+            self.failed,
+            self.skipped,
+            self.docs_per_sec,
+        )
+
+    @property
+    def docs_per_sec(self) -> float:
+        return self.indexed / self.elapsed if self.elapsed else 0.0
+
+    @backoff.on_exception(
+        wait_gen=backoff.expo,
+        exception=(ElasticsearchException, HTTPError),
+        max_tries=10,
+    )
+    def _send(self, actions: list[tuple[bytes, bytes]]) -> list[dict]:
+        with metrics.stage(self.label, "bulk"):
+            response = self.es.bulk(body=encode_body(actions))
+        return response["items"]
+
+    def _commit_checkpoint(self) -> None:
+        if self._checkpoint and self.on_checkpoint is not None:
+            self.on_checkpoint(self._checkpoint)
+        self._checkpoint = {}
+
+    def __enter__(self) -> "BulkLoader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
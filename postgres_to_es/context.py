@@ -0,0 +1,174 @@
+import logging
+import os
+import resource
+from typing import Callable, Optional
+
+import backoff
+import psycopg2
+from elasticsearch import Elasticsearch
+from psycopg2.extensions import connection as _connection
+
+from serializers import ESSerializer
+
+# Ошибки обрыва соединения: запрос имеет смысл повторить после переподключения.
+PG_DISCONNECT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+def peak_rss_kb() -> int:
+    """Пиковый объём резидентной памяти процесса с момента последнего сброса, КБ"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def reset_peak_rss() -> None:
+    """
+    Сбросить пиковый объём памяти всего процесса (только Linux). Вызывать только
+    там, где процесс выполняет один конвейер, например в бенчмарке: потоки
+    индексов делят один пик, и сброс из одного исказил бы отчёт другого
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def pg_retry(method):
+    """
+    Повторять запрос стадии при обрыве соединения, не больше PG_MAX_TRIES раз.
+    Перед повтором соединение контекста (`self.context`) откатывается
+    или открывается заново
+    """
+    return backoff.on_exception(
+        backoff.expo,
+        PG_DISCONNECT_ERRORS,
+        max_tries=lambda: int(os.environ.get("PG_MAX_TRIES", 5)),
+        on_backoff=lambda details: details["args"][0].context.reset(),
+    )(method)
+
+
+class PipelineContext:
+    """
+    Общие ресурсы ETL-цикла: один клиент ES с пулом keep-alive соединений
+    и серверный (именованный) курсор PostgreSQL на запрос. Все стадии берут
+    их отсюда, вместо того чтобы создавать клиент и курсор на каждую строку.
+    """
+
+    def __init__(
+        self,
+        pg_conn: _connection,
+        es_host: str,
+        es_maxsize: int = 10,
+        es_timeout: int = 30,
+        itersize: int = 2000,
+        connect: Optional[Callable[[], _connection]] = None,
+    ) -> None:
+        self.pg_conn = pg_conn
+        self.connect = connect
+        self._reconnected = False
+        self.itersize = itersize
+        self._cursors = {}
+        self.rows = 0
+        self.cursors_opened = 0
+        self.reconnects = 0
+
+        self.es = Elasticsearch(
+            [es_host],
+            maxsize=es_maxsize,
+            timeout=es_timeout,
+            retry_on_timeout=True,
+            serializer=ESSerializer(),
+        )
+
+    def cursor(self, name: str, server_side: bool = True):
+        """
+        Серверный курсор для запроса `name`. Строки приходят с сервера
+        порциями по `itersize`, а не всем результатом сразу. Именованный
+        курсор выполняет только один запрос, поэтому на каждый цикл
+        открывается новый, а предыдущий закрывается.
+        Обычный курсор (`server_side=False`) для запросов с LIMIT
+        создаётся один раз и переиспользуется.
+        """
+        if not server_side:
+            if name not in self._cursors:
+                self._cursors[name] = self.pg_conn.cursor()
+                self.cursors_opened += 1
+            return self._cursors[name]
+        previous = self._cursors.pop(name, None)
+        if previous is not None and not previous.closed:
+            previous.close()
+        cursor = self.pg_conn.cursor(name=f"etl_{name}")
+        cursor.itersize = self.itersize
+        self._cursors[name] = cursor
+        self.cursors_opened += 1
+        return cursor
+
+    def release(self, name: str) -> None:
+        """Закрыть курсор запроса и завершить транзакцию, в которой он жил"""
+        cursor = self._cursors.pop(name, None)
+        if cursor is not None and not cursor.closed:
+            cursor.close()
+        self.pg_conn.commit()
+
+    def reset(self) -> None:
+        """
+        Вернуть соединение в рабочее состояние после ошибки: откатить прерванную
+        транзакцию, а разорванное соединение открыть заново через `connect`
+        """
+        self._cursors.clear()
+        try:
+            self.pg_conn.rollback()
+            return
+        except PG_DISCONNECT_ERRORS:
+            if self.connect is None:
+                raise
+        try:
+            pg_conn = self.connect()
+        except psycopg2.OperationalError:
+            # Сервер ещё недоступен: следующая попытка снова придёт сюда.
+            logging.warning("PostgreSQL is unavailable, reconnect postponed.")
+            return
+        if self._reconnected:
+            self.pg_conn.close()
+        self.pg_conn = pg_conn
+        self._reconnected = True
+        self.reconnects += 1
+        logging.warning("PostgreSQL connection re-established.")
+
+    def report(self) -> None:
+        """Вывести, сколько строк прошло через общий клиент ES и курсоры с прошлого отчёта"""
+        if self.rows:
+            logging.info(
+                "Pipeline context: %s rows, %s cursors opened, %s PostgreSQL reconnects, one shared ES client, "
+                "process peak RSS %s KB.",
+                self.rows,
+                self.cursors_opened,
+                self.reconnects,
+                peak_rss_kb(),
+            )
+        self.rows = 0
+        self.cursors_opened = 0
+        self.reconnects = 0
+
+    def close(self) -> None:
+        self.report()
+        for cursor in self._cursors.values():
+            if not cursor.closed:
+                cursor.close()
+        self._cursors.clear()
+        if self._reconnected:
+            # Исходное соединение закрывает тот, кто его открыл, новое — контекст.
+            self.pg_conn.close()
+        self.es.transport.close()
+
+    def __enter__(self) -> "PipelineContext":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,175 @@
+import os
+from time import time
+from typing import Optional
+
+import backoff
+import psycopg2
+from elasticsearch.exceptions import ElasticsearchException
+from urllib3.exceptions import HTTPError
+
+import metrics
+from bulk import BulkLoader
+from context import PipelineContext
+from fingerprints import FingerprintCache
+from producer import ChangeProducer
+from serializers import dumps
+from state import State
+
+
+class Extraction:
+    def __init__(self, context: PipelineContext, query) -> None:
+        self.context = context
+        self.query = query
+
+    def extract_batches(self, ids: list):
+        """
+        Вторая фаза: собрать документы только для переданных id, порциями по itersize.
+        Генератор не повторяет запрос сам: часть порций уже отдана, поэтому ошибка
+        завершает цикл, и следующий начинает заново от сохранённого водяного знака
+        """
+        if not ids:
+            return
+        index = self.query["index"]
+        cursor = self.context.cursor(index)
+        with metrics.stage(index, "query"):
+            cursor.execute(self.query["query"], {"ids": ids})
+        try:
+            while True:
+                with metrics.stage(index, "fetch"):
+                    batch = cursor.fetchmany(cursor.itersize)
+                if not batch:
+                    break
+                self.context.rows += len(batch)
+                metrics.ROWS.inc(len(batch), index=index)
+                yield batch
+        finally:
+            self.context.release(self.query["index"])
+
+
+class Transform:
+    def __init__(self, query, data) -> None:
+        self.query = query
+        self.data = data
+
+    def transform(self):
+        if self.query["index"] == "movies":
+            for f in (
+                "actors_names",
+                "writers_names",
+                "actors",
+                "writers",
+            ):
+                if self.data[f] is None:
+                    self.data[f] = []
+        return self.query["model"](**self.data)
+
+
+class BatchTransform:
+    """
+    Преобразование сразу всей порции строк в готовые JSON-документы для `_bulk`.
+    Для запросов с флагом `trusted` модель не строится: из строки берутся
+    только поля модели и сразу сериализуются. Остальные строки проходят
+    валидацию pydantic.
+    """
+
+    def __init__(self, query, fast_path: bool = True) -> None:
+        self.query = query
+        self.model = query["model"]
+        self.fields = tuple(self.model.__fields__)
+        self.fast_path = fast_path and query.get("trusted", False)
+
+    def transform(self, rows: list) -> list[tuple[str, bytes]]:
+        """Список пар (id документа, тело документа в JSON)"""
+        if self.fast_path:
+            fields = self.fields
+            return [
+                (str(row["id"]), dumps({field: row[field] for field in fields}))
+                for row in rows
+            ]
+        documents = []
+        for row in rows:
+            data_obj = self.model.parse_obj(row)
+            documents.append((str(data_obj.id), dumps(data_obj.dict())))
+        return documents
+
+
+class Load:
+    def __init__(self, context: PipelineContext, query, data_obj) -> None:
+        self.query = query
+        self.data_obj = data_obj
+        self.es = context.es
+
+    @backoff.on_exception(
+        wait_gen=backoff.expo,
+        exception=(ElasticsearchException, HTTPError),
+        max_tries=10,
+    )
+    def load_data(self) -> None:
+        with metrics.stage(self.query["index"], "index"):
+            self.es.index(
+                index=self.query["index"],
+                doc_type="doc",
+                id=self.data_obj.id,
+                body=self.data_obj.dict(),
+            )
+        metrics.DOCUMENTS.inc(index=self.query["index"], result="indexed")
+
+
+def run_cycle(
+    context: PipelineContext,
+    state: State,
+    query,
+    bulk_mode: bool,
+    fingerprints: Optional[FingerprintCache] = None,
+) -> int:
+    """Один цикл ETL индекса, возвращает количество обработанных документов"""
+    index = query["index"]
+    started_at = time()
+
+    def checkpoint_state(updates: dict) -> None:
+        with metrics.stage(index, "checkpoint"):
+            state.update(updates)
+
+    extraction = Extraction(context, query)
+    loader = None
+    if bulk_mode:
+        loader = BulkLoader(
+            context.es,
+            chunk_size=int(os.environ.get("BULK_CHUNK_SIZE", 500)),
+            max_chunk_bytes=int(os.environ.get("BULK_MAX_BYTES", 10 * 1024 * 1024)),
+            max_retries=int(os.environ.get("BULK_MAX_RETRIES", 3)),
+            on_checkpoint=checkpoint_state,
+            fingerprints=fingerprints,
+            label=index,
+        )
+    transform = BatchTransform(query, fast_path=os.environ.get("TRANSFORM_FAST_PATH", "1") == "1")
+    processed = 0
+    try:
+        for ids, checkpoint in ChangeProducer(context, query, state).produce():
+            for batch in extraction.extract_batches(ids):
+                if loader is not None:
+                    with metrics.stage(index, "transform"):
+                        documents = transform.transform(batch)
+                    for doc_id, source in documents:
+                        loader.add_raw(index, doc_id, source)
+                    continue
+                for data in batch:
+                    with metrics.stage(index, "transform"):
+                        data_obj = Transform(query, data).transform()
+                    Load(context, query, data_obj).load_data()
+            processed += len(ids)
+            if loader is not None:
+                loader.checkpoint(checkpoint)
+            else:
+                checkpoint_state(checkpoint)
+    except psycopg2.Error:
+        # После ошибки транзакция непригодна: следующий цикл начнёт на чистом соединении.
+        context.reset()
+        raise
+    if loader is not None:
+        loader.close()
+    if fingerprints is not None:
+        fingerprints.report(index)
+    context.report()
+    metrics.cycle_finished(index, started_at)
+    return processed
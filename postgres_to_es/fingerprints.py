@@ -0,0 +1,107 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Iterable, Optional
+
+
+class FingerprintCache:
+    """
+    Отпечатки документов, уже принятых ES: LRU в памяти поверх SQLite-файла
+    с парами id → hash по каждому индексу. Позволяет не отправлять в `_bulk`
+    документы, которые не изменились с прошлой загрузки.
+    Если индекс в ES пересоздаётся вне ETL, его отпечатки нужно сбросить
+    через `clear`, иначе неизменённые документы в него не попадут.
+    """
+
+    def __init__(self, file_path: str, capacity: int = 100000, table: str = 'fingerprints') -> None:
+        self.capacity = capacity
+        self.table = table
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+
+        self._lru: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(file_path, timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                f'idx TEXT NOT NULL, id TEXT NOT NULL, hash BLOB NOT NULL, PRIMARY KEY (idx, id)'
+                f') WITHOUT ROWID'
+            )
+
+    @staticmethod
+    def digest(source: bytes) -> bytes:
+        return hashlib.blake2b(source, digest_size=16).digest()
+
+    def is_unchanged(self, index: str, doc_id: Any, digest: bytes) -> bool:
+        """Документ уже загружен в ES в точно таком же виде"""
+        key = (index, str(doc_id))
+        with self._lock:
+            known = self._lru.get(key)
+            if known is not None:
+                self._lru.move_to_end(key)
+            else:
+                row = self.connection.execute(
+                    f'SELECT hash FROM {self.table} WHERE idx = ? AND id = ?', key
+                ).fetchone()
+                if row is not None:
+                    known = row[0]
+                    self._remember(key, known)
+            if known == digest:
+                self.hits[index] += 1
+                return True
+            self.misses[index] += 1
+            return False
+
+    def store(self, entries: Iterable[tuple[str, str, bytes]]) -> None:
+        """Запомнить отпечатки документов, подтверждённых ES"""
+        entries = list(entries)
+        if not entries:
+            return
+        with self._lock:
+            with self.connection:
+                self.connection.executemany(
+                    f'INSERT INTO {self.table} (idx, id, hash) VALUES (?, ?, ?) '
+                    f'ON CONFLICT (idx, id) DO UPDATE SET hash = excluded.hash',
+                    entries,
+                )
+            for index, doc_id, digest in entries:
+                self._remember((index, doc_id), digest)
+
+    def clear(self, index: Optional[str] = None) -> None:
+        """Сбросить отпечатки индекса или всех индексов"""
+        with self._lock:
+            with self.connection:
+                if index is None:
+                    self.connection.execute(f'DELETE FROM {self.table}')
+                else:
+                    self.connection.execute(f'DELETE FROM {self.table} WHERE idx = ?', (index,))
+            if index is None:
+                self._lru.clear()
+            else:
+                for key in [key for key in self._lru if key[0] == index]:
+                    del self._lru[key]
+
+    def report(self, index: str) -> None:
+        hits, misses = self.hits[index], self.misses[index]
+        if hits or misses:
+            logging.info(
+                '%s fingerprints: %s unchanged documents skipped, %s changed, hit ratio %.1f%%.',
+                index,
+                hits,
+                misses,
+                100.0 * hits / (hits + misses),
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def _remember(self, key: tuple[str, str], digest: bytes) -> None:
+        self._lru[key] = digest
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
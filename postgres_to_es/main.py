@@ -1,180 +1,115 @@
+import argparse
+import asyncio
 import logging
 import os
 import sys
-from contextlib import closing
-from datetime import datetime
-from inspect import cleandoc
-from time import sleep
+from contextlib import ExitStack, closing, contextmanager
+from functools import partial
 
 import psycopg2
 from dotenv import load_dotenv
 from psycopg2.extras import RealDictCursor
-from urllib3.exceptions import HTTPError
 
-import backoff
-from elasticsearch import Elasticsearch
-from elasticsearch.exceptions import ElasticsearchException
-from models import FilmWork, Genre, Person
-from state import State, BaseStorage, JsonFileStorage
+import async_engine
+import metrics
+from context import PipelineContext
+from etl import run_cycle
+from fingerprints import FingerprintCache
+from queries import queries
+from reindex import blue_green_reindex, full_reindex
+from scheduler import Scheduler
+from state import State, BaseStorage, JsonFileStorage, PostgresStorage, SqliteStorage
 
 logging.basicConfig(level=logging.INFO)
 load_dotenv()
 
-queries = (
-    {
-        "index": "movies",
-        "model": FilmWork,
-        "query": cleandoc(
-            """
-                    SELECT
-                        fw.id,
-                        fw.title,
-                        fw.type,
-                        fw.description,
-                        fw.rating as imdb_rating,
-                        fw.created_at,
-                        fw.updated_at,
-                    JSON_AGG(DISTINCT jsonb_build_object('id', g.id, 'name', g.name)) AS genre,
-                    ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor') AS actors_names,
-                    ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'writer') AS writers_names,
-                    GREATEST(
-                        fw.updated_at,
-                        MAX(g.updated_at),
-                        MAX(DISTINCT p.updated_at) FILTER (WHERE pfw.role = 'writer'),
-                        MAX(DISTINCT p.updated_at) FILTER (WHERE pfw.role = 'actor'),
-                        MAX(DISTINCT p.updated_at) FILTER (WHERE pfw.role = 'director')
-                    ) as all_updated_at,
-                    JSON_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'director') -> 0 AS director,
-                    JSON_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'actor') AS actors,
-                    JSON_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'writer') AS writers
-                    FROM content.film_work fw
-                    LEFT OUTER JOIN content.genre_film_work gfw ON fw.id = gfw.film_work_id
-                    LEFT OUTER JOIN content.genre g ON (gfw.genre_id = g.id)
-                    LEFT OUTER JOIN content.person_film_work pfw ON (fw.id = pfw.film_work_id)
-                    LEFT OUTER JOIN content.person p ON (pfw.person_id = p.id)
-                    GROUP BY fw.id, fw.title, fw.description, fw.rating
-                    HAVING fw.updated_at > %(date)s OR MAX(g.updated_at) > %(date)s OR MAX(p.updated_at) > %(date)s
-                    ORDER BY fw.updated_at;
-                """
-        ),
-    },
-    {
-        "index": "genres",
-        "model": Genre,
-        "query": cleandoc(
-            """
-                     SELECT
-                         g.id,
-                         g.name,
-                         g.created_at,
-                         g.updated_at,
-                         GREATEST(
-                             g.updated_at,
-                             MAX(gfw.created_at),
-                             MAX(fw.updated_at)
-                         ) as all_updated_at,
-                         JSON_AGG(DISTINCT jsonb_build_object(
-                             'id', fw.id,
-                             'title', fw.title)
-                         ) AS films
-                     FROM content.genre g
-                     LEFT OUTER JOIN content.genre_film_work gfw ON (g.id = gfw.genre_id)
-                     LEFT OUTER JOIN content.film_work fw ON (gfw.film_work_id = fw.id)
-                     GROUP BY g.id, g.name
-                     HAVING g.updated_at > %(date)s OR MAX(gfw.created_at) > %(date)s or MAX(fw.updated_at) > %(date)s
-                     ORDER BY g.updated_at;
-                """
-        ),
-    },
-    {
-        "index": "persons",
-        "model": Person,
-        "query": cleandoc(
-            """
-                    SELECT
-                        p.id,
-                        p.full_name,
-                        p.created_at,
-                        p.updated_at,
-                        GREATEST(
-                            p.updated_at,
-                            MAX(pfw.created_at),
-                            MAX(fw.updated_at)
-                        ) AS all_updated_at,
-                        JSON_AGG(DISTINCT jsonb_build_object(
-                            'id', pfw.film_work_id, 
-                            'title', fw.title, 
-                            'role', pfw.role,
-                            'imdb_rating', fw.rating)
-                        ) AS films
-                    FROM content.person p
-                    LEFT OUTER JOIN content.person_film_work pfw ON (p.id = pfw.person_id)
-                    LEFT OUTER JOIN content.film_work fw ON (pfw.film_work_id = fw.id)
-                    GROUP BY p.id, p.full_name
-                    HAVING p.updated_at > %(date)s OR MAX(pfw.created_at) > %(date)s or MAX(fw.updated_at) > %(date)s
-                    ORDER BY p.updated_at;
-                """
-        ),
-    },
-)
+# Ключ advisory-блокировки PostgreSQL: демоны держат её совместно, переиндексация — монопольно.
+ETL_LOCK_KEY = 5526604
 
 
-class Extraction:
-    def __init__(self, conn, query) -> None:
-        self.cursor = conn.cursor()
-        self.query = query
+def make_storage(dsn: dict) -> BaseStorage:
+    """Хранилище состояния, выбранное переменной окружения STATE_STORAGE"""
+    kind = os.environ.get("STATE_STORAGE", "json")
+    if kind == "sqlite":
+        return SqliteStorage(file_path=os.environ.get("STATE_PATH", "state.sqlite"))
+    if kind == "postgres":
+        return PostgresStorage(psycopg2.connect(**dsn))
+    return JsonFileStorage(file_path=os.environ.get("STATE_PATH", "state.json"))
 
-    @backoff.on_exception(
-        wait_gen=backoff.expo, exception=(psycopg2.Error, psycopg2.OperationalError)
-    )
-    def extract(self, since_last_updated):
-        self.cursor.execute(self.query["query"], {"date": (since_last_updated,)})
-        logging.info("Data extracted.")
-        while batch := self.cursor.fetchmany(int(os.environ.get("BATCH_SIZE"))):
-            yield from batch
 
+@contextmanager
+def etl_lock(dsn: dict, exclusive: bool):
+    """
+    Держать блокировку на время работы процесса. Демоны берут её совместно
+    и могут работать параллельно с общим хранилищем состояния; если идёт
+    переиндексация, демон ждёт её окончания. Переиндексация берёт блокировку
+    монопольно и при работающих демонах отказывается стартовать: они писали бы
+    в старый индекс и затирали её водяные знаки
+    """
+    with closing(psycopg2.connect(**dsn)) as conn:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            if exclusive:
+                cursor.execute("SELECT pg_try_advisory_lock(%s);", (ETL_LOCK_KEY,))
+                if not cursor.fetchone()[0]:
+                    raise RuntimeError("ETL daemon is running, stop it before reindexing.")
+            else:
+                cursor.execute("SELECT pg_try_advisory_lock_shared(%s);", (ETL_LOCK_KEY,))
+                if not cursor.fetchone()[0]:
+                    logging.info("Reindex is in progress, waiting for it to finish.")
+                    cursor.execute("SELECT pg_advisory_lock_shared(%s);", (ETL_LOCK_KEY,))
+        yield
 
-class Transform:
-    def __init__(self, conn, query, data) -> None:
-        self.query = query
-        self.data = data
-        self.cursor = conn.cursor()
 
-    def transform(self):
-        if self.query["index"] == "movies":
-            for f in (
-                "actors_names",
-                "writers_names",
-                "actors",
-                "writers",
-            ):
-                if self.data[f] is None:
-                    self.data[f] = []
-        return self.query["model"](**data)
-
-
-class Load:
-    def __init__(self, conn, data_obj) -> None:
-        self.data_obj = data_obj
-        self.cursor = conn.cursor()
-        self.es = Elasticsearch([f'{os.environ.get("ES_HOST")}'])
-
-    @backoff.on_exception(
-        wait_gen=backoff.expo,
-        exception=(ElasticsearchException, HTTPError),
-        max_tries=10,
-    )
-    def load_data(self) -> None:
-        self.es.index(
-            index=query["index"],
-            doc_type="doc",
-            id=self.data_obj.id,
-            body=self.data_obj.dict(),
-        )
-        logging.info("Data loaded.")
+def run_daemon(dsn: dict, state: State) -> None:
+    """Инкрементальная загрузка всех индексов, каждый в своём потоке"""
+    bulk_mode = os.environ.get("LOAD_MODE", "bulk") == "bulk"
+    scheduler = Scheduler()
+    with ExitStack() as stack:
+        fingerprints = None
+        if os.environ.get("FINGERPRINT_PATH"):
+            fingerprints = stack.enter_context(
+                closing(
+                    FingerprintCache(
+                        os.environ["FINGERPRINT_PATH"],
+                        capacity=int(os.environ.get("FINGERPRINT_CACHE_SIZE", 100000)),
+                    )
+                )
+            )
+        for query in queries:
+            # У каждого индекса свои соединения, чтобы медленный индекс не блокировал остальные.
+            pg_conn = stack.enter_context(closing(psycopg2.connect(**dsn, cursor_factory=RealDictCursor)))
+            context = stack.enter_context(
+                PipelineContext(
+                    pg_conn,
+                    connect=partial(psycopg2.connect, **dsn, cursor_factory=RealDictCursor),
+                    es_host=os.environ.get("ES_HOST"),
+                    es_maxsize=int(os.environ.get("ES_MAXSIZE", 10)),
+                    itersize=int(os.environ.get("ITERSIZE", os.environ.get("BATCH_SIZE", 2000))),
+                )
+            )
+            index = query["index"].upper()
+            scheduler.add(
+                query["index"],
+                partial(run_cycle, context, state, query, bulk_mode, fingerprints),
+                interval=float(os.environ.get(f"POLL_INTERVAL_{index}", os.environ.get("POLL_INTERVAL", 1))),
+                max_interval=float(
+                    os.environ.get(f"POLL_MAX_INTERVAL_{index}", os.environ.get("POLL_MAX_INTERVAL", 60))
+                ),
+            )
+        logging.info("PostgreSQL connections are open. Start load movies data.")
+        scheduler.run()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ETL из PostgreSQL в Elasticsearch")
+    parser.add_argument("command", nargs="?", default="run", choices=("run", "full-reindex", "blue-green-reindex"))
+    parser.add_argument("--index", action="append", choices=[query["index"] for query in queries])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--keep-old", action="store_true", help="не удалять прежний индекс после переключения алиаса")
+    args = parser.parse_args()
+
     dsn = {
         "dbname": os.environ.get("POSTGRES_DB"),
         "user": os.environ.get("POSTGRES_USER"),
@@ -182,18 +117,19 @@ if __name__ == "__main__":
         "host": os.environ.get("POSTGRES_HOST"),
         "port": os.environ.get("POSTGRES_PORT"),
     }
-    state = State(storage=JsonFileStorage(file_path="state.json"))
-    with closing(psycopg2.connect(**dsn, cursor_factory=RealDictCursor)) as pg_conn:
-        logging.info("PostgreSQL connection is open. Start load movies data.")
-        while True:
-            for query in queries:
-                state_key = f"last_{query['index']}_updated_at"
-                since = datetime.fromisoformat(state.get_state(state_key) or '1970-01-01T00:00:00')
-                for data in Extraction(pg_conn, query).extract(since_last_updated=since):
-                    data_obj = Transform(pg_conn, query, data).transform()
-                    Load(pg_conn, data_obj).load_data()
-                    state.set_state(
-                        state_key,
-                        data["all_updated_at"].isoformat(),
-                    )
-            sleep(1)
+    if os.environ.get("METRICS_PORT"):
+        metrics.start_http_server(int(os.environ["METRICS_PORT"]))
+    # Состояние читается только после получения блокировки: демон, дождавшийся
+    # конца переиндексации, начинает с записанных ею водяных знаков.
+    with etl_lock(dsn, exclusive=args.command != "run"):
+        state = State(storage=make_storage(dsn))
+        if args.command == "full-reindex":
+            for index in args.index or [query["index"] for query in queries]:
+                full_reindex(dsn, state, index, workers=args.workers, resume=args.resume)
+        elif args.command == "blue-green-reindex":
+            for index in args.index or [query["index"] for query in queries]:
+                blue_green_reindex(dsn, state, index, workers=args.workers, keep_old=args.keep_old)
+        elif os.environ.get("ETL_ENGINE") == "async":
+            asyncio.run(async_engine.run(dsn, state, queries))
+        else:
+            run_daemon(dsn, state)
@@ -0,0 +1,176 @@
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, time
+from typing import Optional
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metric:
+    """Метрика с метками; значения хранятся по кортежу значений меток"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _format_labels(self, key: tuple, extra: Optional[dict] = None) -> str:
+        pairs = list(zip(self.labels, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines += self._render_value(key, value)
+        return lines
+
+    def _render_value(self, key: tuple, value) -> list[str]:
+        return [f"{self.name}{self._format_labels(key)} {value}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class LagGauge(Gauge):
+    """
+    Отставание от PostgreSQL в секундах. Хранится отметка времени, до которой
+    индекс гарантированно догнал базу, а разница с текущим временем
+    считается в момент запроса метрик, поэтому зависший цикл виден сразу.
+    """
+
+    def _render_value(self, key: tuple, value) -> list[str]:
+        return [f"{self.name}{self._format_labels(key)} {max(0.0, time() - value)}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observations = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for number, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[number] += 1
+            self._values[key] = (counts, total + value, observations + 1)
+
+    def _render_value(self, key: tuple, value) -> list[str]:
+        counts, total, observations = value
+        lines = [
+            f"{self.name}_bucket{self._format_labels(key, {'le': bound})} {count}"
+            for bound, count in zip(self.buckets, counts)
+        ]
+        lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': '+Inf'})} {observations}")
+        lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+        lines.append(f"{self.name}_count{self._format_labels(key)} {observations}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(
+    Histogram("etl_stage_seconds", "Duration of ETL stage calls.", ("index", "stage"))
+)
+ROWS = REGISTRY.register(Counter("etl_rows_total", "Rows fetched from PostgreSQL.", ("index",)))
+DOCUMENTS = REGISTRY.register(
+    Counter("etl_documents_total", "Documents sent to Elasticsearch by result.", ("index", "result"))
+)
+CYCLES = REGISTRY.register(Counter("etl_cycles_total", "ETL cycles by outcome.", ("index", "outcome")))
+LAG = REGISTRY.register(
+    LagGauge("etl_lag_seconds", "Seconds the index may be behind PostgreSQL.", ("index",))
+)
+LAST_SUCCESS = REGISTRY.register(
+    Gauge("etl_last_success_timestamp_seconds", "Unix time of the last successful ETL cycle.", ("index",))
+)
+
+
+@contextmanager
+def stage(index: str, name: str):
+    """Засечь длительность вызова стадии `name` индекса `index`"""
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(perf_counter() - started, index=index, stage=name)
+
+
+def cycle_finished(index: str, started_at: float) -> None:
+    """
+    Отметить успешный цикл, начатый в `started_at` (unix time): все
+    изменения, сделанные в PostgreSQL до этого момента, уже загружены в ES
+    """
+    CYCLES.inc(index=index, outcome="success")
+    LAST_SUCCESS.set(time(), index=index)
+    LAG.set(started_at, index=index)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        data = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Отдавать метрики в текстовом формате Prometheus на http://host:port/metrics"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
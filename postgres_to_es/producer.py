@@ -0,0 +1,90 @@
+import logging
+import os
+
+import metrics
+from context import PipelineContext, pg_retry
+from queries import START_WATERMARK
+from state import State
+
+
+def page_watermark(page: list) -> dict:
+    """Водяной знак, указывающий на последнюю строку страницы"""
+    return {"updated_at": page[-1]["updated_at"].isoformat(), "id": str(page[-1]["id"])}
+
+
+def get_watermark(state: State, query, source) -> dict:
+    """Составной водяной знак (updated_at, id) источника из состояния"""
+    watermark = state.get_state(f"{query['index']}_{source['table']}")
+    if watermark is not None:
+        return watermark
+    # Состояние в старом формате хранило только время последнего обновления.
+    legacy = state.get_state(f"last_{query['index']}_updated_at")
+    if legacy is not None and source.get("resolve") is None:
+        return {**START_WATERMARK, "updated_at": legacy}
+    return dict(START_WATERMARK)
+
+
+class ChangeProducer:
+    """
+    Находит изменения во всех таблицах, от которых зависит индекс,
+    переводит их в id документов индекса через индексированные выборки
+    и отдаёт без повторов внутри страницы. Работа цикла пропорциональна
+    объёму изменений, а не размеру каталога.
+    """
+
+    def __init__(self, context: PipelineContext, query, state: State) -> None:
+        self.context = context
+        self.query = query
+        self.state = state
+
+    def produce(self):
+        """Пары (id документов, состояние для сохранения после их загрузки)"""
+        affected = 0
+        for source in self.query["sources"]:
+            state_key = f"{self.query['index']}_{source['table']}"
+            for page in self.changes(source, get_watermark(self.state, self.query, source)):
+                ids = [row["id"] for row in page]
+                if source.get("resolve") is not None:
+                    ids = self._resolve(source, ids)
+                # Повторы убираются только внутри страницы: документ, собранный раньше
+                # в этом цикле, мог измениться после сборки, и его нужно собрать заново.
+                fresh = list(dict.fromkeys(ids))
+                affected += len(fresh)
+                yield fresh, {state_key: page_watermark(page)}
+        if affected:
+            logging.info("%s: %s documents affected by changes.", self.query["index"], affected)
+
+    def changes(self, source, watermark: dict):
+        """
+        Страницы изменившихся строк таблицы-источника,
+        упорядоченные по (updated_at, id) начиная с водяного знака
+        """
+        limit = int(os.environ.get("BATCH_SIZE"))
+        while page := self._fetch_changes(source, watermark, limit):
+            yield page
+            watermark = page_watermark(page)
+            if len(page) < limit:
+                break
+
+    @pg_retry
+    def _fetch_changes(self, source, watermark: dict, limit: int) -> list:
+        index = self.query["index"]
+        cursor = self.context.cursor(f"{index}_{source['table']}", server_side=False)
+        with metrics.stage(index, "query"):
+            cursor.execute(source["query"], {**watermark, "limit": limit})
+        with metrics.stage(index, "fetch"):
+            page = cursor.fetchall()
+        # Транзакция закрывается сразу: простаивающий цикл не держит её открытой до следующего опроса.
+        self.context.pg_conn.commit()
+        return page
+
+    @pg_retry
+    def _resolve(self, source, ids: list) -> list:
+        cursor = self.context.cursor(
+            f"{self.query['index']}_{source['table']}_resolve", server_side=False
+        )
+        with metrics.stage(self.query["index"], "resolve"):
+            cursor.execute(source["resolve"], {"ids": ids})
+            ids = [row["id"] for row in cursor.fetchall()]
+        self.context.pg_conn.commit()
+        return ids
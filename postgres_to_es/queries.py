@@ -0,0 +1,201 @@
+from inspect import cleandoc
+
+from models import FilmWork, Genre, Person
+
+# Начальное значение составного водяного знака (updated_at, id).
+START_WATERMARK = {
+    "updated_at": "1970-01-01T00:00:00+00:00",
+    "id": "00000000-0000-0000-0000-000000000000",
+}
+
+
+def changes_query(table: str, column: str = "updated_at") -> str:
+    """
+    Первая фаза: дешёвая выборка изменившихся id из базовой таблицы
+    с keyset-пагинацией по паре (column, id)
+    """
+    return cleandoc(
+        f"""
+            SELECT id, {column} AS updated_at
+            FROM content.{table}
+            WHERE ({column}, id) > (%(updated_at)s::timestamptz, %(id)s::uuid)
+            ORDER BY {column}, id
+            LIMIT %(limit)s;
+        """
+    )
+
+
+def range_query(table: str) -> str:
+    """Страница id базовой таблицы внутри диапазона UUID (after, last] для полной переиндексации"""
+    return cleandoc(
+        f"""
+            SELECT id
+            FROM content.{table}
+            WHERE id > %(after)s::uuid AND id <= %(last)s::uuid
+            ORDER BY id
+            LIMIT %(limit)s;
+        """
+    )
+
+
+def latest_query(table: str, column: str = "updated_at") -> str:
+    """Последняя строка таблицы в порядке (column, id) — водяной знак на момент снимка"""
+    return cleandoc(
+        f"""
+            SELECT id, {column} AS updated_at
+            FROM content.{table}
+            ORDER BY {column} DESC, id DESC
+            LIMIT 1;
+        """
+    )
+
+
+def resolve_query(column: str, table: str, key: str = "id") -> str:
+    """Перевести id изменившихся строк источника в id документов индекса"""
+    return cleandoc(
+        f"""
+            SELECT DISTINCT {column} AS id
+            FROM content.{table}
+            WHERE {key} = ANY(%(ids)s::uuid[]);
+        """
+    )
+
+
+queries = (
+    {
+        "index": "movies",
+        "table": "film_work",
+        "model": FilmWork,
+        # Запрос сам гарантирует форму документа (списки вместо NULL, без пустых
+        # объектов от LEFT JOIN), поэтому строки можно не валидировать моделью.
+        "trusted": True,
+        "sources": (
+            {"table": "film_work", "query": changes_query("film_work")},
+            {
+                "table": "genre",
+                "query": changes_query("genre"),
+                "resolve": resolve_query("film_work_id", "genre_film_work", key="genre_id"),
+            },
+            {
+                "table": "person",
+                "query": changes_query("person"),
+                "resolve": resolve_query("film_work_id", "person_film_work", key="person_id"),
+            },
+            {
+                "table": "genre_film_work",
+                "column": "created_at",
+                "query": changes_query("genre_film_work", column="created_at"),
+                "resolve": resolve_query("film_work_id", "genre_film_work"),
+            },
+            {
+                "table": "person_film_work",
+                "column": "created_at",
+                "query": changes_query("person_film_work", column="created_at"),
+                "resolve": resolve_query("film_work_id", "person_film_work"),
+            },
+        ),
+        "query": cleandoc(
+            """
+                    SELECT
+                        fw.id,
+                        fw.title,
+                        fw.type,
+                        fw.description,
+                        fw.rating as imdb_rating,
+                        fw.created_at,
+                        fw.updated_at,
+                    COALESCE(JSON_AGG(DISTINCT jsonb_build_object('id', g.id, 'name', g.name)) FILTER (WHERE g.id IS NOT NULL), '[]') AS genre,
+                    COALESCE(ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor'), '{}') AS actors_names,
+                    COALESCE(ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'writer'), '{}') AS writers_names,
+                    JSON_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'director') -> 0 AS director,
+                    COALESCE(JSON_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'actor'), '[]') AS actors,
+                    COALESCE(JSON_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'writer'), '[]') AS writers
+                    FROM content.film_work fw
+                    LEFT OUTER JOIN content.genre_film_work gfw ON fw.id = gfw.film_work_id
+                    LEFT OUTER JOIN content.genre g ON (gfw.genre_id = g.id)
+                    LEFT OUTER JOIN content.person_film_work pfw ON (fw.id = pfw.film_work_id)
+                    LEFT OUTER JOIN content.person p ON (pfw.person_id = p.id)
+                    WHERE fw.id = ANY(%(ids)s::uuid[])
+                    GROUP BY fw.id, fw.title, fw.description, fw.rating;
+                """
+        ),
+    },
+    {
+        "index": "genres",
+        "table": "genre",
+        "model": Genre,
+        "trusted": True,
+        "sources": (
+            {"table": "genre", "query": changes_query("genre")},
+            {
+                "table": "film_work",
+                "query": changes_query("film_work"),
+                "resolve": resolve_query("genre_id", "genre_film_work", key="film_work_id"),
+            },
+            {
+                "table": "genre_film_work",
+                "column": "created_at",
+                "query": changes_query("genre_film_work", column="created_at"),
+                "resolve": resolve_query("genre_id", "genre_film_work"),
+            },
+        ),
+        "query": cleandoc(
+            """
+                     SELECT
+                         g.id,
+                         g.name,
+                         g.created_at,
+                         g.updated_at,
+                         COALESCE(JSON_AGG(DISTINCT jsonb_build_object(
+                             'id', fw.id,
+                             'title', fw.title)
+                         ) FILTER (WHERE fw.id IS NOT NULL), '[]') AS films
+                     FROM content.genre g
+                     LEFT OUTER JOIN content.genre_film_work gfw ON (g.id = gfw.genre_id)
+                     LEFT OUTER JOIN content.film_work fw ON (gfw.film_work_id = fw.id)
+                     WHERE g.id = ANY(%(ids)s::uuid[])
+                     GROUP BY g.id, g.name;
+                """
+        ),
+    },
+    {
+        "index": "persons",
+        "table": "person",
+        "model": Person,
+        "trusted": True,
+        "sources": (
+            {"table": "person", "query": changes_query("person")},
+            {
+                "table": "film_work",
+                "query": changes_query("film_work"),
+                "resolve": resolve_query("person_id", "person_film_work", key="film_work_id"),
+            },
+            {
+                "table": "person_film_work",
+                "column": "created_at",
+                "query": changes_query("person_film_work", column="created_at"),
+                "resolve": resolve_query("person_id", "person_film_work"),
+            },
+        ),
+        "query": cleandoc(
+            """
+                    SELECT
+                        p.id,
+                        p.full_name,
+                        p.created_at,
+                        p.updated_at,
+                        COALESCE(JSON_AGG(DISTINCT jsonb_build_object(
+                            'id', pfw.film_work_id,
+                            'title', fw.title,
+                            'role', pfw.role,
+                            'imdb_rating', fw.rating)
+                        ) FILTER (WHERE fw.id IS NOT NULL), '[]') AS films
+                    FROM content.person p
+                    LEFT OUTER JOIN content.person_film_work pfw ON (p.id = pfw.person_id)
+                    LEFT OUTER JOIN content.film_work fw ON (pfw.film_work_id = fw.id)
+                    WHERE p.id = ANY(%(ids)s::uuid[])
+                    GROUP BY p.id, p.full_name;
+                """
+        ),
+    },
+)
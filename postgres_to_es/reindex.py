@@ -0,0 +1,269 @@
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import uuid
+from contextlib import closing
+from functools import partial
+from datetime import datetime
+from time import monotonic
+from typing import Optional
+
+import psycopg2
+from elasticsearch import Elasticsearch
+from psycopg2.extras import RealDictCursor
+
+from bulk import BulkLoader
+from context import PipelineContext
+from etl import BatchTransform, Extraction
+from producer import ChangeProducer
+from queries import latest_query, queries, range_query
+from state import State
+
+MAX_UUID = 2 ** 128 - 1
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config")
+
+
+def uuid_ranges(count: int) -> list[tuple[str, str]]:
+    """Разбить пространство UUID на `count` диапазонов вида (after, last]"""
+    bounds = [MAX_UUID * number // count for number in range(count + 1)]
+    return [
+        (str(uuid.UUID(int=bounds[number])), str(uuid.UUID(int=bounds[number + 1])))
+        for number in range(count)
+    ]
+
+
+def find_query(index: str) -> dict:
+    return next(query for query in queries if query["index"] == index)
+
+
+def reindex_range(task: tuple) -> int:
+    """
+    Переиндексировать один диапазон id в отдельном процессе со своими
+    соединениями и своим BulkLoader. Прогресс отправляется в очередь
+    родителю после каждой подтверждённой ES пачки.
+    """
+    dsn, index, target, number, after, last, progress = task
+    query = find_query(index)
+    limit = int(os.environ.get("BATCH_SIZE", 100))
+    processed = 0
+    with closing(psycopg2.connect(**dsn, cursor_factory=RealDictCursor)) as pg_conn, PipelineContext(
+        pg_conn,
+        connect=partial(psycopg2.connect, **dsn, cursor_factory=RealDictCursor),
+        es_host=os.environ.get("ES_HOST"),
+        es_maxsize=2,
+        itersize=int(os.environ.get("ITERSIZE", limit)),
+    ) as context:
+        extraction = Extraction(context, query)
+        transform = BatchTransform(query, fast_path=os.environ.get("TRANSFORM_FAST_PATH", "1") == "1")
+        loader = BulkLoader(
+            context.es,
+            chunk_size=int(os.environ.get("BULK_CHUNK_SIZE", 500)),
+            max_chunk_bytes=int(os.environ.get("BULK_MAX_BYTES", 10 * 1024 * 1024)),
+            max_retries=int(os.environ.get("BULK_MAX_RETRIES", 3)),
+            on_checkpoint=lambda updates: progress.put((number, updates["after"])),
+            label=index,
+        )
+        with loader:
+            cursor = context.cursor(f"{index}_range", server_side=False)
+            while True:
+                cursor.execute(range_query(query["table"]), {"after": after, "last": last, "limit": limit})
+                ids = [row["id"] for row in cursor.fetchall()]
+                for batch in extraction.extract_batches(ids):
+                    for doc_id, source in transform.transform(batch):
+                        loader.add_raw(target, doc_id, source)
+                processed += len(ids)
+                if len(ids) < limit:
+                    break
+                after = ids[-1]
+                loader.checkpoint({"after": after})
+            # Диапазон пройден целиком: при возобновлении его можно пропустить.
+            loader.checkpoint({"after": last})
+    return processed
+
+
+def take_snapshot(pg_conn, query) -> dict:
+    """Водяные знаки всех источников индекса на момент начала переиндексации"""
+    snapshot = {}
+    with pg_conn.cursor() as cursor:
+        for source in query["sources"]:
+            cursor.execute(latest_query(source["table"], source.get("column", "updated_at")))
+            row = cursor.fetchone()
+            if row is not None:
+                snapshot[f"{query['index']}_{source['table']}"] = {
+                    "updated_at": row["updated_at"].isoformat(),
+                    "id": str(row["id"]),
+                }
+    pg_conn.commit()
+    return snapshot
+
+
+def full_reindex(
+    dsn: dict,
+    state: State,
+    index: str,
+    workers: int,
+    target: Optional[str] = None,
+    resume: bool = False,
+) -> int:
+    """
+    Полная переиндексация `index` пулом процессов. Базовая таблица делится
+    на диапазоны UUID, каждый диапазон загружает отдельный процесс.
+    Прогресс диапазонов сводится в State, поэтому прерванную переиндексацию
+    можно продолжить с `resume=True`. По окончании водяные знаки
+    инкрементальной загрузки ставятся на снимок, сделанный перед стартом.
+    """
+    query = find_query(index)
+    target = target or index
+    key = f"reindex_{index}"
+    progress_state = state.get_state(key) if resume else None
+    if not progress_state or progress_state.get("target") != target:
+        with closing(psycopg2.connect(**dsn, cursor_factory=RealDictCursor)) as pg_conn:
+            snapshot = take_snapshot(pg_conn, query)
+        ranges = uuid_ranges(workers * 4)
+        progress_state = {
+            "target": target,
+            "snapshot": snapshot,
+            "ranges": [{"after": after, "last": last} for after, last in ranges],
+        }
+        state.update({key: progress_state})
+
+    started = monotonic()
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager, context.Pool(workers) as pool:
+        progress = manager.Queue()
+        tasks = [
+            (dsn, index, target, number, item["after"], item["last"], progress)
+            for number, item in enumerate(progress_state["ranges"])
+            if item["after"] != item["last"]
+        ]
+        result = pool.map_async(reindex_range, tasks)
+        while not (result.ready() and progress.empty()):
+            try:
+                number, after = progress.get(timeout=1)
+            except queue.Empty:
+                continue
+            progress_state["ranges"][number]["after"] = after
+            state.update({key: progress_state})
+        processed = sum(result.get())
+
+    state.update({**progress_state["snapshot"], key: None})
+    elapsed = monotonic() - started
+    logging.info(
+        "Full reindex of %s into %s: %s documents in %.1f s (%.1f docs/sec).",
+        index,
+        target,
+        processed,
+        elapsed,
+        processed / elapsed if elapsed else 0.0,
+    )
+    return processed
+
+
+def catch_up(dsn: dict, state: State, index: str, target: str) -> int:
+    """
+    Догнать `target` изменениями, сделанными после снимка: обычный цикл
+    инкрементальной загрузки от водяных знаков снимка, но с записью в `target`
+    """
+    query = find_query(index)
+    processed = 0
+    with closing(psycopg2.connect(**dsn, cursor_factory=RealDictCursor)) as pg_conn, PipelineContext(
+        pg_conn,
+        connect=partial(psycopg2.connect, **dsn, cursor_factory=RealDictCursor),
+        es_host=os.environ.get("ES_HOST"),
+        es_maxsize=2,
+        itersize=int(os.environ.get("ITERSIZE", os.environ.get("BATCH_SIZE", 2000))),
+    ) as context:
+        extraction = Extraction(context, query)
+        transform = BatchTransform(query, fast_path=os.environ.get("TRANSFORM_FAST_PATH", "1") == "1")
+        loader = BulkLoader(
+            context.es,
+            chunk_size=int(os.environ.get("BULK_CHUNK_SIZE", 500)),
+            max_chunk_bytes=int(os.environ.get("BULK_MAX_BYTES", 10 * 1024 * 1024)),
+            max_retries=int(os.environ.get("BULK_MAX_RETRIES", 3)),
+            on_checkpoint=state.update,
+            label=index,
+        )
+        with loader:
+            for ids, checkpoint in ChangeProducer(context, query, state).produce():
+                for batch in extraction.extract_batches(ids):
+                    for doc_id, source in transform.transform(batch):
+                        loader.add_raw(target, doc_id, source)
+                processed += len(ids)
+                loader.checkpoint(checkpoint)
+    logging.info("%s: %s changed documents caught up in %s.", index, processed, target)
+    return processed
+
+
+def load_schema(index: str) -> dict:
+    with open(os.path.join(SCHEMA_DIR, f"{index}_schema.json")) as f:
+        return json.load(f)
+
+
+def swap_alias(es: Elasticsearch, alias: str, new_index: str) -> list[str]:
+    """
+    Атомарно переключить алиас на новый индекс. Если под именем алиаса
+    живёт обычный индекс (создан create_indexes.sh), он удаляется тем же
+    запросом. Возвращает индексы, на которые алиас указывал раньше.
+    """
+    actions = []
+    previous = []
+    if es.indices.exists_alias(name=alias):
+        previous = list(es.indices.get_alias(name=alias))
+        actions += [{"remove": {"index": index, "alias": alias}} for index in previous]
+    elif es.indices.exists(index=alias):
+        actions.append({"remove_index": {"index": alias}})
+    actions.append({"add": {"index": new_index, "alias": alias}})
+    es.indices.update_aliases(body={"actions": actions})
+    return previous
+
+
+def blue_green_reindex(dsn: dict, state: State, index: str, workers: int, keep_old: bool = False) -> str:
+    """
+    Переиндексация без простоя: новый версионный индекс заполняется
+    с отключённым refresh и без реплик, затем настройки восстанавливаются,
+    сегменты сливаются и алиас `index` атомарно переключается на него.
+    Читатели до переключения видят старый индекс целиком.
+
+    Демоны инкрементальной загрузки на это время должны быть остановлены
+    (main.py берёт монопольную блокировку, которую демоны держат совместно):
+    они писали бы изменения в старый индекс и затирали водяные знаки снимка. Изменения,
+    сделанные во время загрузки, перед переключением догружаются в новый
+    индекс через `catch_up`.
+    """
+    es = Elasticsearch([os.environ.get("ES_HOST")], timeout=60, retry_on_timeout=True)
+    schema = load_schema(index)
+    settings = schema.get("settings", {})
+    new_index = f"{index}_{datetime.utcnow():%Y%m%d%H%M%S}"
+
+    live_settings = {}
+    live = index
+    if es.indices.exists_alias(name=index):
+        live = next(iter(es.indices.get_alias(name=index)))
+    if es.indices.exists(index=live):
+        live_settings = es.indices.get_settings(index=live)[live]["settings"]["index"]
+    replicas = live_settings.get("number_of_replicas", settings.get("number_of_replicas", 1))
+    refresh_interval = settings.get("refresh_interval", "1s")
+
+    bulk_settings = {**settings, "refresh_interval": "-1", "number_of_replicas": 0}
+    es.indices.create(index=new_index, body={**schema, "settings": bulk_settings})
+    logging.info("Index %s created, loading it.", new_index)
+
+    full_reindex(dsn, state, index, workers=workers, target=new_index)
+
+    es.indices.put_settings(
+        index=new_index,
+        body={"index": {"refresh_interval": refresh_interval, "number_of_replicas": replicas}},
+    )
+    es.indices.forcemerge(index=new_index, max_num_segments=1, request_timeout=3600)
+    es.indices.refresh(index=new_index)
+    es.cluster.health(index=new_index, wait_for_status="yellow", request_timeout=600)
+    catch_up(dsn, state, index, new_index)
+
+    previous = swap_alias(es, index, new_index)
+    logging.info("Alias %s now points to %s.", index, new_index)
+    if previous and not keep_old:
+        es.indices.delete(index=",".join(previous))
+        logging.info("Old indices removed: %s.", ", ".join(previous))
+    return new_index
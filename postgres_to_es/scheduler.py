@@ -0,0 +1,75 @@
+import logging
+import signal
+import threading
+from typing import Callable
+
+import metrics
+
+
+class IndexWorker(threading.Thread):
+    """
+    Поток, который по расписанию запускает цикл ETL одного индекса.
+    Если изменений не было, интервал опроса удваивается до `max_interval`,
+    при появлении изменений возвращается к `interval`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        cycle: Callable[[], int],
+        stop: threading.Event,
+        interval: float = 1.0,
+        max_interval: float = 60.0,
+    ) -> None:
+        super().__init__(name=f"etl-{name}", daemon=True)
+        self.index = name
+        self.cycle = cycle
+        self.stop = stop
+        self.interval = interval
+        self.max_interval = max_interval
+
+    def run(self) -> None:
+        delay = self.interval
+        while not self.stop.is_set():
+            try:
+                processed = self.cycle()
+            except Exception:
+                logging.exception("%s: ETL cycle failed.", self.index)
+                metrics.CYCLES.inc(index=self.index, outcome="failure")
+                processed = 0
+            if processed:
+                delay = self.interval
+            else:
+                delay = min(delay * 2, self.max_interval)
+            self.stop.wait(delay)
+
+
+class Scheduler:
+    """Запускает циклы ETL всех индексов параллельно, каждый в своём потоке"""
+
+    def __init__(self) -> None:
+        self.stop = threading.Event()
+        self.workers: list[IndexWorker] = []
+
+    def add(
+        self,
+        name: str,
+        cycle: Callable[[], int],
+        interval: float = 1.0,
+        max_interval: float = 60.0,
+    ) -> None:
+        self.workers.append(IndexWorker(name, cycle, self.stop, interval, max_interval))
+
+    def run(self) -> None:
+        """Запустить все потоки и ждать SIGINT/SIGTERM"""
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, self._shutdown)
+        for worker in self.workers:
+            worker.start()
+        while any(worker.is_alive() for worker in self.workers):
+            for worker in self.workers:
+                worker.join(timeout=1)
+
+    def _shutdown(self, signum, frame) -> None:
+        logging.info("Signal %s received, stopping ETL workers.", signum)
+        self.stop.set()
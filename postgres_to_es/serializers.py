@@ -0,0 +1,86 @@
+import datetime
+import decimal
+import json
+import os
+import uuid
+from typing import Any
+
+from elasticsearch.exceptions import SerializationError
+from elasticsearch.serializer import JSONSerializer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def default(obj: Any) -> Any:
+    """Типы, которые не умеет сериализовать стандартный json"""
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class StdlibBackend:
+    name = "json"
+
+    @staticmethod
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, default=default, ensure_ascii=False, separators=(",", ":")).encode()
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+
+class OrjsonBackend:
+    name = "orjson"
+
+    @staticmethod
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+
+BACKENDS = {StdlibBackend.name: StdlibBackend, OrjsonBackend.name: OrjsonBackend}
+
+
+def get_backend(name: str = None):
+    """
+    Бэкенд сериализации по имени или из переменной JSON_BACKEND.
+    По умолчанию orjson, если он установлен, иначе стандартный json.
+    """
+    name = name or os.environ.get("JSON_BACKEND") or ("orjson" if orjson is not None else "json")
+    if name == "orjson" and orjson is None:
+        raise RuntimeError("JSON_BACKEND=orjson, but orjson is not installed.")
+    return BACKENDS[name]
+
+
+backend = get_backend()
+dumps = backend.dumps
+loads = backend.loads
+
+
+class ESSerializer(JSONSerializer):
+    """Сериализатор клиента ES на выбранном бэкенде"""
+
+    def dumps(self, data):
+        if isinstance(data, (str, bytes)):
+            return data
+        try:
+            return dumps(data).decode()
+        except TypeError as e:
+            raise SerializationError(data, e)
+
+    def loads(self, s):
+        try:
+            return loads(s)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(s, e)
@@ -1,9 +1,20 @@
 import abc
 import json
+import os
+import sqlite3
+import tempfile
+import threading
 from typing import Any, Optional
 
+from psycopg2.extensions import connection as _connection
+from psycopg2.extensions import cursor as _cursor
+from psycopg2.extras import Json, execute_values
+
 
 class BaseStorage:
+    # Хранилища с поключевой записью получают в save_state только изменённые ключи.
+    per_key = False
+
     @abc.abstractmethod
     def save_state(self, state: dict) -> None:
         """Сохранить состояние в постоянное хранилище"""
@@ -20,9 +31,28 @@ class JsonFileStorage(BaseStorage):
         self.file_path = file_path
 
     def save_state(self, state: dict) -> None:
-        """Сохранить состояние в постоянное хранилище"""
-        with open(self.file_path, 'w') as f:
-            json.dump(state, f)
+        """
+        Сохранить состояние в постоянное хранилище атомарно: пишем во временный
+        файл рядом, сбрасываем его на диск и переименовываем поверх старого
+        """
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.state-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        if hasattr(os, 'O_DIRECTORY'):
+            # Переименование становится устойчивым к сбою только после fsync каталога.
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
 
     def retrieve_state(self) -> dict:
         """Загрузить состояние локально из постоянного хранилища"""
@@ -33,26 +63,128 @@ class JsonFileStorage(BaseStorage):
             return {}
 
 
+class SqliteStorage(BaseStorage):
+    """
+    Состояние в SQLite в режиме WAL: каждый ключ хранится отдельной строкой,
+    поэтому несколько воркеров могут писать свои ключи, не затирая чужие
+    """
+
+    per_key = True
+
+    def __init__(self, file_path: str, table: str = 'etl_state'):
+        self.table = table
+        self.connection = sqlite3.connect(file_path, timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+            )
+
+    def save_state(self, state: dict) -> None:
+        """Сохранить переданные ключи, остальные ключи хранилища не трогаются"""
+        with self.connection:
+            self.connection.executemany(
+                f'INSERT INTO {self.table} (key, value) VALUES (?, ?) '
+                f'ON CONFLICT (key) DO UPDATE SET value = excluded.value',
+                [(key, json.dumps(value)) for key, value in state.items()],
+            )
+
+    def retrieve_state(self) -> dict:
+        """Загрузить состояние локально из постоянного хранилища"""
+        rows = self.connection.execute(f'SELECT key, value FROM {self.table}')
+        return {key: json.loads(value) for key, value in rows}
+
+
+class PostgresStorage(BaseStorage):
+    """
+    Состояние в таблице PostgreSQL: каждый ключ хранится отдельной строкой,
+    при записи строки блокируются (SELECT ... FOR UPDATE), поэтому
+    параллельные воркеры безопасно обновляют каждый свои водяные знаки.
+    Соединение должно быть отдельным от соединения, из которого читает ETL.
+    """
+
+    per_key = True
+
+    def __init__(self, connection: _connection, table: str = 'etl_state'):
+        self.connection = connection
+        self.table = table
+        with self.connection, self.connection.cursor(cursor_factory=_cursor) as cursor:
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    key TEXT PRIMARY KEY,
+                    value JSONB NOT NULL,
+                    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+                )
+                """
+            )
+
+    def save_state(self, state: dict) -> None:
+        """Сохранить переданные ключи, остальные ключи хранилища не трогаются"""
+        keys = sorted(state)
+        with self.connection, self.connection.cursor(cursor_factory=_cursor) as cursor:
+            # Ключи блокируются в одном порядке, чтобы воркеры не попадали во взаимную блокировку.
+            cursor.execute(
+                f'SELECT key FROM {self.table} WHERE key = ANY(%s) ORDER BY key FOR UPDATE',
+                (keys,),
+            )
+            execute_values(
+                cursor,
+                f"""
+                INSERT INTO {self.table} (key, value) VALUES %s
+                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = now()
+                """,
+                [(key, Json(state[key])) for key in keys],
+            )
+
+    def retrieve_state(self) -> dict:
+        """Загрузить состояние локально из постоянного хранилища"""
+        with self.connection, self.connection.cursor(cursor_factory=_cursor) as cursor:
+            cursor.execute(f'SELECT key, value FROM {self.table}')
+            return dict(cursor.fetchall())
+
+
 class State:
     """
     Класс для хранения состояния при работе с данными, чтобы постоянно не перечитывать данные с начала.
     Здесь представлена реализация с сохранением состояния в файл.
     В целом ничего не мешает поменять это поведение на работу с БД или распределённым хранилищем.
+    Состояние хранится в памяти и попадает в хранилище только при вызове `checkpoint`.
+    Объект можно использовать из нескольких потоков.
     """
 
     def __init__(self, storage: BaseStorage):
         self.storage = storage
+        self._state = storage.retrieve_state()
+        self._dirty = set()
+        self._lock = threading.RLock()
 
     def set_state(self, key: str, value: Any) -> None:
         """Установить состояние для определённого ключа"""
-        # self.state = State(storage=JsonFileStorage(file_path="state.json"))
-        state = self.storage.retrieve_state()
-        state[key] = value
-        self.storage.save_state(state)
+        with self._lock:
+            self._state[key] = value
+            self._dirty.add(key)
 
     def get_state(self, key: str) -> Any:
         """Получить состояние по определённому ключу"""
-        try:
-            return self.storage.retrieve_state()[key]
-        except KeyError:
-            return None
+        with self._lock:
+            return self._state.get(key)
+
+    def update(self, updates: dict) -> None:
+        """Установить состояние для нескольких ключей и сразу сохранить его"""
+        with self._lock:
+            for key, value in updates.items():
+                self.set_state(key, value)
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """Сохранить накопленные изменения в хранилище"""
+        with self._lock:
+            if not self._dirty:
+                return
+            if self.storage.per_key:
+                self.storage.save_state({key: self._state[key] for key in self._dirty})
+            else:
+                self.storage.save_state(dict(self._state))
+            self._dirty = set()
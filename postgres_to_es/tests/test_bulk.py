@@ -0,0 +1,142 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import bulk
+from bulk import BulkLoader, BulkRetryError, split_results
+from fingerprints import FingerprintCache
+
+
+def item(status: int, doc_id: str = "1") -> dict:
+    return {"index": {"_id": doc_id, "status": status, "error": None if status < 300 else "rejected"}}
+
+
+class FakeES:
+    """
+    Отвечает на `_bulk` статусами из `statuses` по очереди запросов, по умолчанию 201.
+    Элемент-список задаёт статусы документов запроса по отдельности
+    """
+
+    def __init__(self, *statuses) -> None:
+        self.statuses = list(statuses)
+        self.bodies = []
+
+    def bulk(self, body: bytes) -> dict:
+        self.bodies.append(body)
+        count = body.count(b"\n") // 2
+        statuses = self.statuses.pop(0) if self.statuses else 201
+        if not isinstance(statuses, list):
+            statuses = [statuses] * count
+        return {"items": [item(status, str(number)) for number, status in enumerate(statuses)]}
+
+
+class SplitResultsTest(unittest.TestCase):
+    def test_classifies_statuses(self):
+        actions = ["ok", "conflict", "busy", "gateway", "error"]
+        items = [item(201), item(409), item(429), item(504), item(500)]
+        with self.assertLogs(level="ERROR"):
+            accepted, failed, retry = split_results(actions, items)
+        self.assertEqual(accepted, ["ok"])
+        self.assertEqual(failed, 2)
+        self.assertEqual(retry, ["busy", "gateway"])
+
+
+@mock.patch.object(bulk, "sleep", lambda seconds: None)
+class BulkLoaderCheckpointTest(unittest.TestCase):
+    def make_loader(self, es, **kwargs):
+        self.saved = []
+        return BulkLoader(es, on_checkpoint=self.saved.append, **kwargs)
+
+    def test_checkpoint_waits_for_buffered_documents(self):
+        loader = self.make_loader(FakeES(), chunk_size=10)
+        loader.add("movies", 1, {"title": "a"})
+        loader.checkpoint({"wm": 1})
+        self.assertEqual(self.saved, [])
+        loader.close()
+        self.assertEqual(self.saved, [{"wm": 1}])
+
+    def test_checkpoint_without_buffer_is_saved_at_once(self):
+        loader = self.make_loader(FakeES())
+        loader.checkpoint({"wm": 1})
+        self.assertEqual(self.saved, [{"wm": 1}])
+
+    def test_checkpoints_follow_chunks_in_order(self):
+        es = FakeES()
+        loader = self.make_loader(es, chunk_size=2)
+        loader.add("movies", 1, {})
+        loader.checkpoint({"wm": 1})
+        loader.add("movies", 2, {})
+        self.assertEqual(self.saved, [{"wm": 1}])
+        loader.checkpoint({"wm": 2})
+        loader.close()
+        self.assertEqual(self.saved, [{"wm": 1}, {"wm": 2}])
+        self.assertEqual(len(es.bodies), 1)
+
+    def test_retry_then_commit(self):
+        es = FakeES(429)
+        loader = self.make_loader(es, max_retries=2)
+        loader.add("movies", 1, {})
+        loader.checkpoint({"wm": 1})
+        with self.assertLogs(level="WARNING"):
+            loader.close()
+        self.assertEqual(len(es.bodies), 2)
+        self.assertEqual(loader.indexed, 1)
+        self.assertEqual(self.saved, [{"wm": 1}])
+
+    def test_exhausted_retries_keep_checkpoint(self):
+        loader = self.make_loader(FakeES(429, 429, 429), max_retries=2)
+        loader.add("movies", 1, {})
+        loader.add("movies", 2, {})
+        loader.checkpoint({"wm": 1})
+        with self.assertLogs(level="WARNING"), self.assertRaises(BulkRetryError):
+            loader.close()
+        self.assertEqual(self.saved, [])
+        self.assertEqual(loader.indexed, 0)
+
+    def test_permanent_rejection_is_skipped(self):
+        loader = self.make_loader(FakeES(400))
+        loader.add("movies", 1, {})
+        loader.checkpoint({"wm": 1})
+        with self.assertLogs(level="ERROR"):
+            loader.close()
+        self.assertEqual(loader.failed, 1)
+        self.assertEqual(self.saved, [{"wm": 1}])
+
+
+class BulkLoaderFingerprintTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.fingerprints = FingerprintCache(os.path.join(directory.name, "fingerprints.sqlite"))
+        self.addCleanup(self.fingerprints.close)
+
+    def load(self, docs: dict) -> BulkLoader:
+        loader = BulkLoader(FakeES(), max_chunk_bytes=80, fingerprints=self.fingerprints)
+        for doc_id, doc in docs.items():
+            loader.add("movies", doc_id, doc)
+        loader.close()
+        return loader
+
+    def test_rejected_copy_of_duplicate_id_is_not_remembered(self):
+        first, second = {"title": "A"}, {"title": "B"}
+        loader = BulkLoader(FakeES([201, 400]), fingerprints=self.fingerprints)
+        loader.add("movies", "x", first)
+        loader.add("movies", "x", second)
+        with self.assertLogs(level="ERROR"):
+            loader.close()
+
+        # В ES осталась версия A: её можно пропускать, а B нужно отправить снова.
+        self.assertTrue(self.fingerprints.is_unchanged("movies", "x", self.fingerprints.digest(bulk.dumps(first))))
+        self.assertFalse(self.fingerprints.is_unchanged("movies", "x", self.fingerprints.digest(bulk.dumps(second))))
+
+    def test_documents_overflowing_chunk_are_remembered(self):
+        docs = {"a": {"title": "1" * 20}, "b": {"title": "2" * 20}}
+        self.assertEqual(self.load(docs).indexed, 2)
+        second = self.load(docs)
+        self.assertEqual(second.skipped, 2)
+        self.assertEqual(second.indexed, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
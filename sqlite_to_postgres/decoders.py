@@ -0,0 +1,86 @@
+import dataclasses
+import datetime
+import uuid
+
+from db_classes import FilmWork, Genre, GenreFilmWork, Person, PersonFilmWork
+
+# Датаклассы, описывающие колонки таблиц PostgreSQL.
+DATA_CLASSES = {
+    "genre": Genre,
+    "person": Person,
+    "film_work": FilmWork,
+    "genre_film_work": GenreFilmWork,
+    "person_film_work": PersonFilmWork,
+}
+
+
+def parse_timestamp(value: str) -> datetime.datetime:
+    """
+    Время из SQLite вида '2021-06-16 20:14:09.30973+00'. В Python 3.9
+    fromisoformat требует 3 или 6 знаков долей секунды и зону вида +00:00.
+    """
+    end = len(value)
+    for position in range(19, len(value)):
+        if value[position] in "+-Z":
+            end = position
+            break
+    body, zone = value[:end], value[end:]
+    if "." in body:
+        base, fraction = body.split(".", 1)
+        body = f"{base}.{fraction[:6]:0<6}"
+    if zone == "Z":
+        zone = "+00:00"
+    elif len(zone) == 3:
+        zone += ":00"
+    return datetime.datetime.fromisoformat(body + zone)
+
+
+def parse_date(value: str) -> datetime.date:
+    return datetime.date.fromisoformat(value[:10])
+
+
+COERCERS = {
+    uuid.UUID: uuid.UUID,
+    datetime.datetime: parse_timestamp,
+    datetime.date: parse_date,
+}
+
+
+class RowDecoder:
+    """
+    Декодер строк одной таблицы, собранный один раз: колонки SQLite
+    выбираются по именам колонок PostgreSQL, значения приводятся к UUID,
+    date и datetime, на выходе — готовые для записи кортежи.
+    """
+
+    def __init__(self, table: str, source_columns):
+        data_class = DATA_CLASSES[table]
+        fields = dataclasses.fields(data_class)
+        missing = [field.name for field in fields if field.name not in source_columns]
+        if missing:
+            raise ValueError(f"SQLite table {table} has no columns: {', '.join(missing)}.")
+
+        self.table = table
+        self.columns = tuple(field.name for field in fields)
+        # rowid выбирается первым, чтобы отмечать прогресс переноса.
+        self.query = f"SELECT rowid, {', '.join(self.columns)} FROM {table}"
+        self._coercers = tuple(
+            (position, COERCERS[field.type])
+            for position, field in enumerate(fields)
+            if field.type in COERCERS
+        )
+
+    def decode(self, row) -> tuple:
+        """Строка выборки `query` без rowid в кортеж значений колонок `columns`"""
+        values = list(row[1:])
+        for position, coerce in self._coercers:
+            value = values[position]
+            if value is not None:
+                values[position] = coerce(value)
+        return tuple(values)
+
+
+def build_decoder(cursor, table: str) -> RowDecoder:
+    """Собрать декодер по фактическим колонкам таблицы SQLite"""
+    source_columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+    return RowDecoder(table, source_columns)
@@ -1,29 +1,139 @@
+import argparse
 import logging
+import multiprocessing
 import os
 import sqlite3
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from contextlib import closing
+from time import monotonic
 
 import psycopg2
 from dotenv import load_dotenv
-from postgres_saver import PostgresSaver
-from psycopg2.extensions import connection as _connection
-from psycopg2.extras import DictCursor
-from sqlite_loader import SQLiteLoader
+from postgres_saver import MigrationCheckpoints, PostgresSaver
+from sqlite_loader import TABLES, SQLiteLoader
+from verify import bucket_range, verify
 
 logging.basicConfig(level=logging.INFO)
 load_dotenv()
 
+# Таблицы, которые должны быть загружены и закоммичены раньше таблицы-ключа.
+DEPENDENCIES = {
+    "genre": (),
+    "person": (),
+    "film_work": (),
+    "genre_film_work": ("film_work", "genre"),
+    "person_film_work": ("film_work", "person"),
+}
 
-def load_from_sqlite(connection: sqlite3.Connection, pg_conn: _connection):
-    """Основной метод загрузки данных из SQLite в Postgres"""
-    postgres_saver = PostgresSaver(pg_conn)
-    sqlite_loader = SQLiteLoader(connection)
 
-    data = sqlite_loader.load_movies()
-    postgres_saver.save_all_data(data)
+def migrate_range(task: tuple) -> tuple[int, int]:
+    """
+    Перенести диапазон rowid (after, last] таблицы в отдельном процессе
+    со своими соединениями SQLite и Postgres. Каждая порция коммитится
+    вместе с отметкой прогресса, начиная с уже пройденного rowid `done`.
+    """
+    sqlite_path, dsn, table, after, last, done = task
+    read = inserted = 0
+    with closing(sqlite3.connect(sqlite_path)) as connection, closing(psycopg2.connect(**dsn)) as pg_conn:
+        with closing(connection.cursor()) as sqlite_cursor:
+            loader = SQLiteLoader(sqlite_cursor, chunk_size=int(os.environ.get("CHUNK_SIZE", 10000)))
+            saver = PostgresSaver(pg_conn, mode=os.environ.get("WRITE_MODE", "copy"))
+            checkpoints = MigrationCheckpoints(pg_conn)
+            columns = loader.decoder(table).columns
+            for last_rowid, rows in loader.load_chunks(table, done, last):
+                chunk_read, chunk_inserted = saver.save_rows(table, columns, rows)
+                checkpoints.advance(table, after, last_rowid)
+                pg_conn.commit()
+                read += chunk_read
+                inserted += chunk_inserted
+            checkpoints.advance(table, after, last)
+            pg_conn.commit()
+    return read, inserted
+
+
+def migrate(sqlite_path: str, dsn: dict, workers: int, resume: bool = False) -> dict:
+    """
+    Перенести все таблицы пулом из `workers` процессов. Родительские таблицы
+    грузятся одновременно, таблица связей запускается, как только закоммичены
+    все её родители, и делится на `workers` диапазонов rowid.
+    С `resume=True` продолжает прерванный перенос по сохранённым отметкам.
+    Возвращает по каждой таблице количество строк и время загрузки.
+    """
+    with closing(psycopg2.connect(**dsn)) as pg_conn:
+        PostgresSaver(pg_conn).ensure_tables()
+        checkpoints = MigrationCheckpoints(pg_conn)
+        checkpoints.ensure()
+        ranges = checkpoints.ranges() if resume else {}
+        if ranges:
+            logging.info("Resuming migration from saved checkpoints.")
+        else:
+            with closing(sqlite3.connect(sqlite_path)) as connection, closing(connection.cursor()) as sqlite_cursor:
+                loader = SQLiteLoader(sqlite_cursor)
+                fresh = {
+                    table: loader.rowid_ranges(table, workers if DEPENDENCIES[table] else 1)
+                    for table in TABLES
+                }
+            checkpoints.reset(fresh)
+            ranges = {table: [(after, last, after) for after, last in items] for table, items in fresh.items()}
+    ranges = {
+        table: [(after, last, done) for after, last, done in ranges.get(table, []) if done < last]
+        for table in TABLES
+    }
+
+    finished = {}
+    progress = {}
+    running = {}
+
+    def finish(table: str) -> None:
+        table_progress = progress.pop(table)
+        finished[table] = {
+            "read": table_progress["read"],
+            "inserted": table_progress["inserted"],
+            "seconds": monotonic() - table_progress["started"],
+        }
+        logging.info(
+            "%s: %s rows read, %s new, %.2f s.",
+            table,
+            finished[table]["read"],
+            finished[table]["inserted"],
+            finished[table]["seconds"],
+        )
+
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        while len(finished) < len(TABLES):
+            for table in TABLES:
+                if table in finished or table in progress:
+                    continue
+                if not all(parent in finished for parent in DEPENDENCIES[table]):
+                    continue
+                progress[table] = {"read": 0, "inserted": 0, "left": len(ranges[table]), "started": monotonic()}
+                for after, last, done in ranges[table]:
+                    running[pool.submit(migrate_range, (sqlite_path, dsn, table, after, last, done))] = table
+                if not ranges[table]:
+                    finish(table)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                table = running.pop(future)
+                read, inserted = future.result()
+                progress[table]["read"] += read
+                progress[table]["inserted"] += inserted
+                progress[table]["left"] -= 1
+                if not progress[table]["left"]:
+                    finish(table)
+    return finished
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перенос данных из SQLite в PostgreSQL")
+    parser.add_argument("command", nargs="?", default="migrate", choices=("migrate", "verify"))
+    parser.add_argument("--sqlite", default="db.sqlite", help="путь к файлу SQLite")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="количество процессов загрузки")
+    parser.add_argument("--resume", action="store_true", help="продолжить прерванный перенос")
+    parser.add_argument("--prefix-length", type=int, default=2, help="длина префикса id для verify, 1-8")
+    args = parser.parse_args()
+
     dsn = {
         "dbname": os.environ.get("POSTGRES_DB"),
         "user": os.environ.get("POSTGRES_USER"),
@@ -31,6 +141,21 @@ if __name__ == "__main__":
         "host": os.environ.get("POSTGRES_HOST"),
         "port": os.environ.get("POSTGRES_PORT"),
     }
-    with psycopg2.connect(**dsn, cursor_factory=DictCursor) as psql_conn:
-        with closing(sqlite3.connect('db.sqlite').cursor()) as sqlite_cursor:
-            load_from_sqlite(sqlite_cursor, psql_conn)
+    if args.command == "verify":
+        mismatches = verify(args.sqlite, dsn, prefix_length=args.prefix_length)
+        for table, ranges in mismatches.items():
+            for bucket, source, target in ranges:
+                print(
+                    f"{table}: {bucket_range(bucket)} sqlite {source[0]} rows, postgres {target[0]} rows"
+                    f"{', hashes differ' if source[0] == target[0] else ''}"
+                )
+        if any(mismatches.values()):
+            sys.exit(1)
+        print("All tables match.")
+        sys.exit(0)
+
+    started = monotonic()
+    table_stats = migrate(args.sqlite, dsn, max(args.workers, 1), resume=args.resume)
+    for table, stats in table_stats.items():
+        print(f"{table:>18}: {stats['read']:>9} rows {stats['inserted']:>9} new {stats['seconds']:>8.2f} s")
+    print(f"{'total':>18}: {monotonic() - started:.2f} s")
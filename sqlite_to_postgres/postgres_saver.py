@@ -1,14 +1,69 @@
+import io
 import logging
 import os
+from itertools import islice
 
 import psycopg2
 from psycopg2.extensions import connection as _connection
+from psycopg2.extras import execute_values, register_uuid
+
+WRITE_MODES = ("copy", "values")
+
+# Декодеры отдают uuid.UUID, execute_values должен уметь их передавать.
+register_uuid()
+
+
+# Экранирование значений для текстового формата COPY.
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def encode_copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    return str(value).translate(COPY_ESCAPES)
+
+
+class CopyStream(io.TextIOBase):
+    """
+    Файлоподобная обёртка над генератором кортежей для COPY ... FROM STDIN
+    в текстовом формате: строки кодируются по мере чтения, а не все сразу
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.count = 0
+        self._buffer = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        parts = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            line = "\t".join(map(encode_copy_value, row)) + "\n"
+            parts.append(line)
+            length += len(line)
+            self.count += 1
+        data = "".join(parts)
+        if size < 0:
+            self._buffer = ""
+            return data
+        self._buffer = data[size:]
+        return data[:size]
 
 
 class PostgresSaver:
-    def __init__(self, psql_conn: _connection):
+    def __init__(self, psql_conn: _connection, mode: str = "copy", page_size: int = 1000):
+        if mode not in WRITE_MODES:
+            raise ValueError(f"Unknown write mode {mode!r}, expected one of {WRITE_MODES}.")
         self.connection = psql_conn
         self.cursor = self.connection.cursor()
+        self.mode = mode
+        self.page_size = page_size
 
     def create_tables(self):
         path = os.path.abspath(
@@ -18,30 +73,111 @@ class PostgresSaver:
         logging.info("Schema was created.")
         self.connection.commit()
 
-    def save_all_data(self, data):
-        for table in data:
-            for data_table in data[table]:
-                columns_names = data_table.keys()
-
-                try:
-                    self.cursor.execute(
-                        "INSERT into content.{0} ({1}) VALUES ({2}) ON CONFLICT (id) DO NOTHING".format(
-                            table,
-                            ", ".join(columns_names),
-                            ", ".join("%s" for _ in range(len(columns_names))),
-                        ),
-                        tuple(data_table.values()),
-                    )
-                except psycopg2.DatabaseError as error:
-                    logging.exception(error)
-                    self.cursor.execute(
-                        "select * from pg_tables where schemaname='content';"
-                    )
-                    if not bool(self.cursor.rowcount):
-                        self.create_tables()
-
-
-            logging.info(
-                f"Data from {table} was migrated."
+    def ensure_tables(self):
+        self.cursor.execute("SELECT 1 FROM pg_tables WHERE schemaname = 'content';")
+        if not bool(self.cursor.rowcount):
+            self.create_tables()
+
+    def save_rows(self, table: str, columns: tuple, rows) -> tuple[int, int]:
+        """Записать кортежи значений `columns`, при ошибке откатить транзакцию"""
+        try:
+            return self.save_table(table, columns, rows)
+        except psycopg2.DatabaseError as error:
+            logging.exception(error)
+            self.connection.rollback()
+            raise
+
+    def save_table(self, table: str, columns: tuple, rows) -> tuple[int, int]:
+        """Записать кортежи в content.{table}, вернуть количество прочитанных и вставленных строк"""
+        if self.mode == "values":
+            return self._save_values(table, columns, rows)
+        return self._save_copy(table, columns, rows)
+
+    def _save_copy(self, table: str, columns: tuple, rows) -> tuple[int, int]:
+        """
+        COPY во временную таблицу и одна вставка из неё: конфликты по id
+        и уникальным ключам разрешаются сервером за один запрос
+        """
+        names = ", ".join(columns)
+        staging = f"staging_{table}"
+        self.cursor.execute(
+            f"CREATE TEMP TABLE {staging} (LIKE content.{table} INCLUDING DEFAULTS) ON COMMIT DROP;"
+        )
+        stream = CopyStream(rows)
+        self.cursor.copy_expert(f"COPY {staging} ({names}) FROM STDIN", stream)
+        self.cursor.execute(
+            f"INSERT INTO content.{table} ({names}) SELECT {names} FROM {staging} ON CONFLICT DO NOTHING;"
+        )
+        inserted = self.cursor.rowcount
+        self.cursor.execute(f"DROP TABLE {staging};")
+        return stream.count, inserted
+
+    def _save_values(self, table: str, columns: tuple, rows) -> tuple[int, int]:
+        """Запасной путь без COPY: многострочные INSERT страницами по page_size"""
+        sql = f"INSERT INTO content.{table} ({', '.join(columns)}) VALUES %s ON CONFLICT DO NOTHING"
+        read = inserted = 0
+        rows = iter(rows)
+        while page := list(islice(rows, self.page_size)):
+            execute_values(self.cursor, sql, page, page_size=self.page_size)
+            read += len(page)
+            inserted += self.cursor.rowcount
+        return read, inserted
+
+
+class MigrationCheckpoints:
+    """
+    Прогресс переноса по диапазонам rowid таблиц SQLite в таблице PostgreSQL.
+    Отметка обновляется в той же транзакции, что и порция данных, поэтому
+    после сбоя перенос продолжается ровно с первой незакоммиченной порции.
+    """
+
+    def __init__(self, psql_conn: _connection, table: str = "sqlite_migration_checkpoint"):
+        self.connection = psql_conn
+        self.table = table
+
+    def ensure(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    table_name TEXT NOT NULL,
+                    range_after BIGINT NOT NULL,
+                    range_last BIGINT NOT NULL,
+                    done BIGINT NOT NULL,
+                    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+                    PRIMARY KEY (table_name, range_after)
+                );
+                """
+            )
+        self.connection.commit()
+
+    def ranges(self) -> dict:
+        """Сохранённые диапазоны по таблицам: [(after, last, done), ...]"""
+        ranges = {}
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT table_name, range_after, range_last, done FROM {self.table} ORDER BY table_name, range_after;"
             )
+            for table, after, last, done in cursor.fetchall():
+                ranges.setdefault(table, []).append((after, last, done))
         self.connection.commit()
+        return ranges
+
+    def reset(self, ranges: dict):
+        """Начать перенос заново с диапазонами {таблица: [(after, last), ...]}"""
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table};")
+            execute_values(
+                cursor,
+                f"INSERT INTO {self.table} (table_name, range_after, range_last, done) VALUES %s",
+                [(table, after, last, after) for table, items in ranges.items() for after, last in items],
+            )
+        self.connection.commit()
+
+    def advance(self, table: str, range_after: int, done: int):
+        """Отметить диапазон пройденным до rowid `done`; коммит делает вызывающий вместе с данными"""
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {self.table} SET done = %s, updated_at = now() WHERE table_name = %s AND range_after = %s;",
+                (done, table, range_after),
+            )
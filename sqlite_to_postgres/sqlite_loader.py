@@ -1,33 +1,56 @@
-import logging
-import sqlite3
-from dataclasses import asdict
+from typing import Optional
 
-from db_classes import FilmWork, Genre, GenreFilmWork, Person, PersonFilmWork
+from decoders import RowDecoder, build_decoder
+
+TABLES = ("genre", "person", "film_work", "genre_film_work", "person_film_work")
 
 
 class SQLiteLoader:
-    def __init__(self, sqlite_cursor):
+    def __init__(self, sqlite_cursor, chunk_size: int = 10000):
         self.cursor = sqlite_cursor
+        self.chunk_size = chunk_size
+        self._decoders = {}
+
+    def decoder(self, table) -> RowDecoder:
+        """Декодер строк таблицы, собирается один раз на таблицу"""
+        if table not in self._decoders:
+            self._decoders[table] = build_decoder(self.cursor, table)
+        return self._decoders[table]
+
+    def load_table(self, table, after: Optional[int] = None, last: Optional[int] = None):
+        """Строки таблицы по одной, с чтением из SQLite порциями по chunk_size"""
+        for _, rows in self.load_chunks(table, after, last):
+            yield from rows
+
+    def load_chunks(self, table, after: Optional[int] = None, last: Optional[int] = None):
+        """
+        Порции по chunk_size строк вида (rowid последней строки, кортежи).
+        `after` и `last` ограничивают диапазон rowid (after, last]
+        """
+        conditions, params = [], []
+        if after is not None:
+            conditions.append("rowid > ?")
+            params.append(after)
+        if last is not None:
+            conditions.append("rowid <= ?")
+            params.append(last)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        # Ошибка чтения поднимается дальше: иначе непрочитанный диапазон был бы отмечен пройденным.
+        decoder = self.decoder(table)
+        self.cursor.execute(f"{decoder.query}{where} ORDER BY rowid", params)
+
+        decode = decoder.decode
+        while rows := self.cursor.fetchmany(self.chunk_size):
+            yield rows[-1][0], [decode(row) for row in rows]
 
-    def load_movies(self):
-        def get_data(table):
-
-            try:
-                rows = self.cursor.execute(f"SELECT * FROM {table}").fetchall()
-            except sqlite3.Error as error:
-                logging.info(error)
-
-            data_from_table = [
-                asdict(
-                    eval("".join(word.capitalize() for word in table.split("_")))(*row)
-                )
-                for row in rows
-            ]
-            return data_from_table
-
-        data = {}
-        tables = ["genre", "person", "film_work", "genre_film_work", "person_film_work"]
-        for table in tables:
-            data_list = {f"{table}": get_data(table)}
-            data.update(data_list)
-        return data
+    def rowid_ranges(self, table, parts: int) -> list[tuple[int, int]]:
+        """Разбить таблицу на `parts` диапазонов rowid вида (after, last]"""
+        low, high = self.cursor.execute(f"SELECT min(rowid), max(rowid) FROM {table}").fetchone()
+        if low is None:
+            return []
+        bounds = [low - 1 + (high - low + 1) * number // parts for number in range(parts + 1)]
+        return [
+            (bounds[number], bounds[number + 1])
+            for number in range(parts)
+            if bounds[number] < bounds[number + 1]
+        ]
@@ -0,0 +1,60 @@
+import datetime
+import unittest
+import uuid
+
+from decoders import RowDecoder, parse_date, parse_timestamp
+
+UTC = datetime.timezone.utc
+
+
+class ParseTimestampTest(unittest.TestCase):
+    def test_short_fraction_and_hour_offset(self):
+        self.assertEqual(
+            parse_timestamp("2021-06-16 20:14:09.30973+00"),
+            datetime.datetime(2021, 6, 16, 20, 14, 9, 309730, tzinfo=UTC),
+        )
+
+    def test_without_fraction(self):
+        self.assertEqual(
+            parse_timestamp("2021-06-16 20:14:09+00"), datetime.datetime(2021, 6, 16, 20, 14, 9, tzinfo=UTC)
+        )
+
+    def test_long_fraction_is_truncated(self):
+        self.assertEqual(parse_timestamp("2021-06-16 20:14:09.1234567+00").microsecond, 123456)
+
+    def test_zone_forms(self):
+        expected = datetime.datetime(2021, 6, 16, 20, 14, 9, tzinfo=UTC)
+        self.assertEqual(parse_timestamp("2021-06-16 20:14:09Z"), expected)
+        self.assertEqual(parse_timestamp("2021-06-16 23:14:09+03"), expected)
+        self.assertEqual(parse_timestamp("2021-06-16 17:14:09-03:00"), expected)
+
+    def test_naive(self):
+        self.assertIsNone(parse_timestamp("2021-06-16 20:14:09.5").tzinfo)
+
+
+class RowDecoderTest(unittest.TestCase):
+    def test_parse_date(self):
+        self.assertEqual(parse_date("2020-01-02 00:00:00"), datetime.date(2020, 1, 2))
+
+    def test_decode_skips_rowid_and_coerces(self):
+        decoder = RowDecoder("genre", ["id", "name", "description", "created_at", "updated_at", "extra"])
+        self.assertEqual(decoder.columns, ("id", "name", "description", "created_at", "updated_at"))
+        row = (7, "3d825f60-9fff-4dfe-b294-1a45fa1e115d", "Drama", None, "2021-06-16 20:14:09.30973+00", None)
+        self.assertEqual(
+            decoder.decode(row),
+            (
+                uuid.UUID("3d825f60-9fff-4dfe-b294-1a45fa1e115d"),
+                "Drama",
+                None,
+                datetime.datetime(2021, 6, 16, 20, 14, 9, 309730, tzinfo=UTC),
+                None,
+            ),
+        )
+
+    def test_missing_columns(self):
+        with self.assertRaises(ValueError):
+            RowDecoder("genre", ["id", "name"])
+
+
+if __name__ == "__main__":
+    unittest.main()
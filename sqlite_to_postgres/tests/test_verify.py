@@ -0,0 +1,90 @@
+import datetime
+import hashlib
+import unittest
+import uuid
+
+from verify import NULL, bucket_range, canonical_sql, canonical_value, float_text, row_hash
+
+
+class FloatTextTest(unittest.TestCase):
+    """Ожидаемые строки — вывод float8::text PostgreSQL 12+ с extra_float_digits = 1"""
+
+    def test_matches_postgres(self):
+        cases = [
+            (8.6, "8.6"),
+            (9.0, "9"),
+            (10.0, "10"),
+            (0.0, "0"),
+            (-0.0, "-0"),
+            (0.1 + 0.2, "0.30000000000000004"),
+            (0.0001, "0.0001"),
+            (1e-05, "1e-05"),
+            (-2.5e-07, "-2.5e-07"),
+            (123456789012345.6, "123456789012345.6"),
+            (1e15, "1e+15"),
+            (1000000000000000.5, "1.0000000000000005e+15"),
+            (1e16, "1e+16"),
+            (1.5e300, "1.5e+300"),
+            (float("nan"), "NaN"),
+            (float("inf"), "Infinity"),
+            (float("-inf"), "-Infinity"),
+        ]
+        for value, expected in cases:
+            with self.subTest(value=value):
+                self.assertEqual(float_text(value), expected)
+
+
+class CanonicalValueTest(unittest.TestCase):
+    def test_null(self):
+        self.assertEqual(canonical_value(None), NULL)
+
+    def test_timestamp_in_utc_with_microseconds(self):
+        # to_char(col AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS.US')
+        moscow = datetime.timezone(datetime.timedelta(hours=3))
+        value = datetime.datetime(2021, 6, 16, 23, 14, 9, 309730, tzinfo=moscow)
+        self.assertEqual(canonical_value(value), "2021-06-16 20:14:09.309730")
+        self.assertEqual(
+            canonical_value(datetime.datetime(2021, 6, 16, 20, 14, 9, tzinfo=datetime.timezone.utc)),
+            "2021-06-16 20:14:09.000000",
+        )
+
+    def test_date(self):
+        self.assertEqual(canonical_value(datetime.date(2020, 1, 2)), "2020-01-02")
+
+    def test_uuid_and_text(self):
+        value = uuid.UUID("3d825f60-9fff-4dfe-b294-1a45fa1e115d")
+        self.assertEqual(canonical_value(value), "3d825f60-9fff-4dfe-b294-1a45fa1e115d")
+        self.assertEqual(canonical_value(""), "")
+
+
+class CanonicalSqlTest(unittest.TestCase):
+    def test_expressions_by_type(self):
+        self.assertEqual(
+            canonical_sql("created_at", datetime.datetime),
+            "coalesce(to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS.US'), '\\N')",
+        )
+        self.assertEqual(
+            canonical_sql("creation_date", datetime.date), "coalesce(to_char(creation_date, 'YYYY-MM-DD'), '\\N')"
+        )
+        self.assertEqual(canonical_sql("rating", float), "coalesce(rating::text, '\\N')")
+
+
+class RowHashTest(unittest.TestCase):
+    def test_signed_first_64_bits_of_md5(self):
+        # ('x' || substr(md5('abc|\N'), 1, 16))::bit(64)::bigint
+        prefix = int(hashlib.md5(b"abc|\\N").hexdigest()[:16], 16)
+        expected = prefix - 2 ** 64 if prefix >= 2 ** 63 else prefix
+        self.assertEqual(row_hash(["abc", None]), expected)
+
+    def test_range(self):
+        for text in ("a", "b", "c", "d", "e"):
+            self.assertTrue(-(2 ** 63) <= row_hash([text]) < 2 ** 63)
+
+    def test_bucket_range(self):
+        self.assertEqual(
+            bucket_range("ab"), "ab000000-0000-0000-0000-000000000000..abffffff-ffff-ffff-ffff-ffffffffffff"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
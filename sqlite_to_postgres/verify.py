@@ -0,0 +1,125 @@
+import dataclasses
+import datetime
+import hashlib
+import math
+import sqlite3
+import uuid
+from contextlib import closing
+from decimal import Decimal
+
+import psycopg2
+from decoders import DATA_CLASSES
+from sqlite_loader import TABLES, SQLiteLoader
+
+NULL = "\\N"
+
+
+def canonical_sql(column: str, column_type) -> str:
+    """Выражение PostgreSQL, дающее тот же текст значения, что и `canonical_value`"""
+    if column_type is datetime.datetime:
+        expression = f"to_char({column} AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS.US')"
+    elif column_type is datetime.date:
+        expression = f"to_char({column}, 'YYYY-MM-DD')"
+    else:
+        expression = f"{column}::text"
+    return f"coalesce({expression}, '{NULL}')"
+
+
+def float_text(value: float) -> str:
+    """
+    double precision в тексте PostgreSQL 12+: кратчайшая точная запись, как repr,
+    но экспонента уже с порядка 15 (repr — с 16) и без «.0» у целых
+    """
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "Infinity" if value > 0 else "-Infinity"
+    number = Decimal(repr(value)).normalize()
+    sign, digits, exponent = number.as_tuple()
+    order = len(digits) - 1 + exponent
+    if -4 <= order < 15:
+        return format(number, "f")
+    mantissa = "".join(map(str, digits)).rstrip("0") or "0"
+    if len(mantissa) > 1:
+        mantissa = f"{mantissa[0]}.{mantissa[1:]}"
+    return f"{'-' if sign else ''}{mantissa}e{order:+03d}"
+
+
+def canonical_value(value) -> str:
+    """Текстовая запись значения из SQLite в том же виде, что и `canonical_sql`"""
+    if value is None:
+        return NULL
+    if isinstance(value, datetime.datetime):
+        return value.astimezone(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, float):
+        return float_text(value)
+    return str(value)
+
+
+def row_hash(values) -> int:
+    """Первые 64 бита md5 строки как знаковое целое, как (x || md5)::bit(64)::bigint в PostgreSQL"""
+    digest = int(hashlib.md5("|".join(map(canonical_value, values)).encode()).hexdigest()[:16], 16)
+    return digest - 2 ** 64 if digest >= 2 ** 63 else digest
+
+
+def postgres_buckets(pg_conn, table: str, prefix_length: int) -> dict:
+    """Количество строк и сумма хэшей по префиксам id, посчитанные на стороне PostgreSQL"""
+    fields = dataclasses.fields(DATA_CLASSES[table])
+    row = ", ".join(canonical_sql(field.name, field.type) for field in fields)
+    with pg_conn.cursor() as cursor:
+        # Кратчайшая точная запись float8, которой следует float_text, включена при значении > 0.
+        cursor.execute("SET extra_float_digits = 1;")
+        cursor.execute(
+            f"""
+            SELECT left(id::text, %(length)s) AS bucket,
+                   count(*),
+                   sum(('x' || substr(md5(concat_ws('|', {row})), 1, 16))::bit(64)::bigint)
+            FROM content.{table}
+            GROUP BY 1;
+            """,
+            {"length": prefix_length},
+        )
+        return {bucket: (count, int(total)) for bucket, count, total in cursor.fetchall()}
+
+
+def sqlite_buckets(loader: SQLiteLoader, table: str, prefix_length: int) -> dict:
+    """То же для SQLite, потоком по порциям без загрузки таблицы в память"""
+    id_position = loader.decoder(table).columns.index("id")
+    buckets = {}
+    for values in loader.load_table(table):
+        bucket = str(values[id_position])[:prefix_length]
+        count, total = buckets.get(bucket, (0, 0))
+        buckets[bucket] = (count + 1, total + row_hash(values))
+    return buckets
+
+
+def verify(sqlite_path: str, dsn: dict, prefix_length: int = 2) -> dict:
+    """
+    Сравнить таблицы SQLite и content.* по диапазонам id с общим префиксом
+    длины `prefix_length`. Возвращает только несовпавшие диапазоны:
+    {таблица: [(префикс, (строк, хэш) в SQLite, (строк, хэш) в PostgreSQL)]}
+    """
+    if not 1 <= prefix_length <= 8:
+        raise ValueError("prefix_length must be between 1 and 8 hex digits.")
+    mismatches = {}
+    with closing(sqlite3.connect(sqlite_path)) as connection, closing(psycopg2.connect(**dsn)) as pg_conn:
+        with closing(connection.cursor()) as sqlite_cursor:
+            loader = SQLiteLoader(sqlite_cursor)
+            for table in TABLES:
+                source = sqlite_buckets(loader, table, prefix_length)
+                target = postgres_buckets(pg_conn, table, prefix_length)
+                mismatches[table] = [
+                    (bucket, source.get(bucket, (0, 0)), target.get(bucket, (0, 0)))
+                    for bucket in sorted(source.keys() | target.keys())
+                    if source.get(bucket) != target.get(bucket)
+                ]
+    return mismatches
+
+
+def bucket_range(bucket: str) -> str:
+    """Диапазон UUID, покрываемый префиксом, для отчёта"""
+    low = uuid.UUID(bucket.ljust(32, "0"))
+    high = uuid.UUID(bucket.ljust(32, "f"))
+    return f"{low}..{high}"